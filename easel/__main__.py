@@ -1,8 +1,12 @@
 import argparse
 import logging
+import os.path
 
+from easel import api
+from easel import cache
 from easel import commands
 from easel import helpers
+from easel import helpers_yaml
 
 def main():
     parser = argparse.ArgumentParser(prog="easel", description="Easel - A Canvas "
@@ -18,6 +22,11 @@ def main():
             "or the db")
     parser.add_argument('--course', '-c', action='append', help="the canvas "
             "course(s) on which to perform the action")
+    parser.add_argument('--stats', action='store_true', help="report request "
+            "statistics when the command finishes")
+    parser.add_argument('--no-cache', action='store_true', help="don't use "
+            "or update the cache of canvas responses and parsed yaml files "
+            "in .easelcache")
     parser.add_argument('--hidden', action='store_true', help="when pushing "
             "the given component, do not publish it")
 
@@ -44,18 +53,38 @@ def main():
     parser_course.add_argument("subcommand_argument", nargs="?")
     parser_course.set_defaults(func=commands.cmd_course)
 
+    ## db commands
+    parser_db = subparsers.add_parser("db", help="database maintenance "
+            "commands")
+    parser_db.add_argument("subcommand", choices=["migrate", "compact",
+        "verify"])
+    parser_db.add_argument("subcommand_argument", nargs="?", help="the "
+            "format to migrate to: sqlite (default), msgpack or json")
+    parser_db.add_argument("--prune", action="store_true", help="verify: "
+            "drop the canvas ids of components that no longer exist in canvas")
+    parser_db.set_defaults(func=commands.cmd_db)
+
     component_arg = "components"
 
     ## pull
     parser_pull = subparsers.add_parser("pull", help="pull components")
     parser_pull.add_argument(component_arg, nargs="*", help="the specific "
             "component(s) to pull")
+    parser_pull.add_argument("--jobs", "-j", type=int, default=1, help="the "
+            "number of components to pull at the same time")
     parser_pull.set_defaults(func=commands.cmd_pull)
 
     ## push
     parser_push = subparsers.add_parser("push", help="push components")
     parser_push.add_argument(component_arg, nargs="*", help="the specific "
             "component(s) to push")
+    parser_push.add_argument("--jobs", "-j", type=int, default=1, help="the "
+            "number of components to push at the same time")
+    parser_push.add_argument("--resume", action="store_true", help="skip the "
+            "components that were already pushed by a push that failed part "
+            "way through")
+    parser_push.add_argument("--force", action="store_true", help="push "
+            "components even if they haven't changed since the last push")
     parser_push.set_defaults(func=commands.cmd_push)
 
     ## remove
@@ -80,9 +109,21 @@ def main():
     elif args.api_dump:
         logging.basicConfig(level=logging.DEBUG)
 
+    if args.no_cache:
+        api.set_cache(False)
+    elif os.path.isfile(helpers.DB_FILE):
+        helpers_yaml.set_disk_cache(os.path.join(cache.CACHE_DIR, "yaml"))
+
     db = helpers.load_db()
-    args.func(db, args)
-    db.close()
+    try:
+        args.func(db, args)
+    finally:
+        # writes to the db are buffered, make sure they make it to the file
+        # even if the command fails
+        db.close()
+
+    if args.stats:
+        api.print_stats()
 
 if __name__ == "__main__":
     main()
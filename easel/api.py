@@ -0,0 +1,518 @@
+import collections
+import concurrent.futures
+import copy
+import json
+import logging
+import os.path
+import random
+import threading
+import time
+import urllib.parse
+
+import requests
+from tqdm import tqdm
+try:
+    # optional, a much faster json codec (pip install easel-cli[fast])
+    import orjson
+except ImportError:
+    orjson = None
+
+from easel import cache
+from easel import helpers
+
+POOL_SIZE=10
+PER_PAGE=100 # the most canvas returns in one page
+# Canvas throttles each token with a leaky bucket and reports how much of the
+# bucket is left on every response
+# https://canvas.instructure.com/doc/api/file.throttling.html
+RATE_LIMIT_LOW=200 # back off when the bucket has less than this left
+RATE_LIMIT_HIGH=500 # allow more requests again when it has more than this
+THROTTLE_WAIT=1 # seconds, doubled each time the same request is throttled
+THROTTLE_RETRIES=8
+# defaults for the connect_timeout, read_timeout and retries options in
+# ~/.easelrc
+CONNECT_TIMEOUT=10 # seconds
+READ_TIMEOUT=60 # seconds
+RETRIES=4
+RETRY_STATUSES=[429, 502, 503, 504]
+RETRY_WAIT=1 # seconds, roughly doubled (with some jitter) on each retry
+RETRY_WAIT_MAX=30
+IDEMPOTENT_METHODS=['GET', 'PUT', 'DELETE']
+
+_client = None
+_client_lock = threading.Lock()
+_pool_size = POOL_SIZE
+_use_cache = True
+# run statistics, reported with the --stats flag
+stats = collections.Counter()
+_stats_lock = threading.Lock()
+# the number of requests canvas rejected for each thread (see failures)
+_failures = threading.local()
+
+class RateLimiter:
+    """Limits the number of requests in flight at once.
+
+    The limit starts at the size of the connection pool. It is halved whenever
+    a response says the rate limit bucket is running low and creeps back up one
+    at a time while the bucket stays healthy. Being throttled outright pauses
+    all requests for a while and drops the limit to a single request. Requests
+    over the limit wait their turn rather than failing."""
+
+    def __init__(self, max_in_flight):
+        self.max_in_flight = max_in_flight
+        self.limit = max_in_flight
+        self.in_flight = 0
+        self.paused_until = 0
+        self.condition = threading.Condition()
+
+    def __repr__(self):
+        return f"RateLimiter(limit={self.limit}, in_flight={self.in_flight})"
+
+    def acquire(self):
+        with self.condition:
+            while True:
+                wait = self.paused_until - time.monotonic()
+                if wait > 0:
+                    self.condition.wait(wait)
+                elif self.in_flight >= self.limit:
+                    self.condition.wait()
+                else:
+                    break
+            self.in_flight += 1
+
+    def release(self, resp=None):
+        with self.condition:
+            self.in_flight -= 1
+            remaining = None
+            if resp is not None:
+                remaining = resp.headers.get('X-Rate-Limit-Remaining')
+            if remaining is not None:
+                remaining = float(remaining)
+                cost = resp.headers.get('X-Request-Cost')
+                logging.debug(f"Rate limit remaining: {remaining}, request cost: {cost}")
+                if remaining < RATE_LIMIT_LOW:
+                    self.limit = max(1, self.limit // 2)
+                elif remaining > RATE_LIMIT_HIGH and self.limit < self.max_in_flight:
+                    self.limit += 1
+            self.condition.notify_all()
+
+    def throttle(self, attempt):
+        with self.condition:
+            self.limit = 1
+            resume = time.monotonic() + THROTTLE_WAIT * 2**attempt
+            self.paused_until = max(self.paused_until, resume)
+            self.condition.notify_all()
+
+def is_throttled(resp):
+    # canvas responds with 403 Forbidden (Rate Limit Exceeded)
+    return resp.status_code == 403 and 'Rate Limit Exceeded' in resp.text
+
+def should_retry(method, resp=None, error=None):
+    """whether a failed request can be sent again without doing the same thing
+    twice"""
+    if method in IDEMPOTENT_METHODS:
+        return error is not None or resp.status_code in RETRY_STATUSES
+    # POST creates a new component each time it goes through, so only send it
+    # again when canvas can't have acted on it: the connection was never made,
+    # or canvas turned the request away before handling it
+    if error is not None:
+        return isinstance(error, requests.ConnectTimeout)
+    return resp.status_code in [429, 503]
+
+def retry_wait(retry, resp=None):
+    """seconds to wait before the given retry (counting from 0)"""
+    if resp is not None:
+        retry_after = resp.headers.get('Retry-After', '')
+        if retry_after.isdigit():
+            return min(int(retry_after), RETRY_WAIT_MAX)
+    wait = min(RETRY_WAIT * 2**retry, RETRY_WAIT_MAX)
+    return wait/2 + random.uniform(0, wait/2)
+
+def loads(content):
+    """decode a json response body"""
+    if orjson is not None:
+        return orjson.loads(content)
+    return json.loads(content)
+
+def dumps(data):
+    """encode a request body as json bytes"""
+    if orjson is not None:
+        try:
+            return orjson.dumps(data, option=orjson.OPT_NON_STR_KEYS)
+        except TypeError:
+            # e.g., an int too big for orjson, let the json module handle it
+            pass
+    return json.dumps(data).encode('utf-8')
+
+def log_json(label, data):
+    """log data as pretty json with --api-dump, without paying for the
+    formatting otherwise"""
+    if logging.getLogger().isEnabledFor(logging.DEBUG):
+        logging.debug(label + json.dumps(data, sort_keys=True, indent=4,
+            default=str))
+
+def count(stat, n=1):
+    with _stats_lock:
+        stats[stat] += n
+
+def failures():
+    """the number of requests made by the current thread that canvas rejected
+    (400, 404 or 500). easel prints those errors and carries on, so this is
+    how a caller can tell whether the work it did actually went through"""
+    return getattr(_failures, "n", 0)
+
+def print_stats():
+    print("requests: {}, saved: {}, retries: {}, throttled: {}, not modified: {}".format(
+        stats["requests"], stats["coalesced"], stats["retries"],
+        stats["throttled"], stats["not_modified"]))
+
+class Client:
+    """A process-wide connection to Canvas.
+
+    The config (~/.easelrc) is read once when the client is created and every
+    request goes through the same requests.Session, so TCP/TLS connections are
+    kept alive and reused instead of being renegotiated on each call. Use
+    get_client() rather than creating one of these directly.
+
+    The results of GET requests are remembered for the rest of the run, and a
+    GET that is already in flight on another thread is waited on rather than
+    sent again. A write drops the remembered results under its path and those
+    of its parent (e.g., the listing of the component), just like the
+    on-disk response cache."""
+
+    def __init__(self, config, pool_size=POOL_SIZE, response_cache=None):
+        self.config = config
+        self.session = requests.Session()
+        adapter = requests.adapters.HTTPAdapter(pool_connections=pool_size,
+                pool_maxsize=pool_size)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+        # the token is only sent on canvas api requests (see request below),
+        # never on a session-wide header, so that uploads and downloads to
+        # other hosts (e.g., the file storage urls canvas hands out) don't
+        # receive it
+        self.headers = {'Authorization': 'Bearer '+config.token}
+        self.limiter = RateLimiter(pool_size)
+        self.timeout = (config.connect_timeout or CONNECT_TIMEOUT,
+                config.read_timeout or READ_TIMEOUT)
+        self.retries = RETRIES if config.retries is None else config.retries
+        self.cache = response_cache
+        self.memo = {}
+        self.pending = {}
+        self.generation = 0 # bumped by every write
+        self.memo_lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Client(hostname={self.config.hostname})"
+
+    def url(self, path):
+        return helpers.HTTPS+self.config.hostname+path
+
+    def send(self, method, url, params=None, data=None):
+        """make a single request to the canvas api, waiting for the rate
+        limit and retrying failures when it's safe to do so"""
+        headers = self.headers
+        body = None
+        if data is not None:
+            # encode the body once rather than on every retry
+            body = dumps(data)
+            headers = dict(headers, **{'Content-Type': 'application/json'})
+        entry = None
+        if self.cache is not None and method == 'GET':
+            entry = self.cache.load(method, url, params)
+            if entry is not None:
+                headers = dict(headers, **self.cache.revalidate_headers(entry))
+
+        retries = 0
+        throttles = 0
+        while True:
+            resp = None
+            error = None
+            self.limiter.acquire()
+            try:
+                # the body is sent as json since canvas expects nested
+                # dictionaries, which requests can't form encode
+                resp = self.session.request(method, url, params=params,
+                        data=body, headers=headers, timeout=self.timeout)
+            except (requests.ConnectionError, requests.Timeout) as e:
+                error = e
+            finally:
+                self.limiter.release(resp)
+            count("requests")
+
+            if resp is not None and is_throttled(resp) and throttles < THROTTLE_RETRIES-1:
+                logging.info(f"Canvas rate limit exceeded, waiting to retry {method} {url}")
+                count("throttled")
+                self.limiter.throttle(throttles)
+                throttles += 1
+                continue
+
+            if retries >= self.retries or not should_retry(method, resp, error):
+                if error is not None:
+                    raise error
+                return self.cached(method, url, params, resp, entry)
+
+            wait = retry_wait(retries, resp)
+            reason = resp.status_code if error is None else type(error).__name__
+            logging.warning(f"{method} {url} failed ({reason}), retrying in {wait:.1f} seconds")
+            count("retries")
+            time.sleep(wait)
+            retries += 1
+
+    def cached(self, method, url, params, resp, entry):
+        """keep the response cache in step with the response to a request,
+        returning the saved response if canvas says it hasn't changed"""
+        if self.cache is None:
+            return resp
+        if method != 'GET':
+            self.cache.invalidate(url)
+        elif resp.status_code == 304 and entry is not None:
+            logging.info(f"Not modified, using cached response for {url}")
+            count("not_modified")
+            entry = self.cache.refresh(method, url, params, entry, resp)
+            return self.cache.response(entry, url)
+        else:
+            self.cache.save(method, url, params, resp)
+        return resp
+
+    def external(self, method, url, **kwargs):
+        """make a request to a non-api url (e.g., uploading or downloading
+        file contents), reusing the pool but without the canvas token"""
+        kwargs.setdefault("timeout", self.timeout)
+        return self.session.request(method, url, **kwargs)
+
+    def request(self, path, params, method, upload=None, dry_run=False):
+        if not path.startswith("/"):
+            raise ValueError('request path must start with /')
+        if method not in ('GET', 'POST', 'PUT', 'DELETE'):
+            raise ValueError('do_request only recognizes GET, POST, PUT, and DELETE methods')
+
+        req_url = self.url(path)
+        data = None
+        if upload is not None and method in ('POST', 'PUT'):
+            data = dict(upload)
+
+        logging.info(f"{method} {req_url}")
+        logging.debug(f"Params: {params}")
+        logging.debug(f"Headers: {self.headers}")
+        log_json("Data: ", data)
+
+        if dry_run:
+            print("DRYRUN - making request (use --api or --api-dump for more details)")
+            return {}
+
+        if method != 'GET':
+            try:
+                return self.fetch(method, req_url, params, data)
+            finally:
+                self.forget(req_url)
+
+        # ask for the biggest pages canvas allows so that listings take as few
+        # requests as possible
+        params = dict(params or {})
+        params.setdefault('per_page', PER_PAGE)
+        return self.get_once(req_url, params)
+
+    def get_once(self, url, params):
+        """GET the url, sharing the result with every other GET of the same
+        url and params during the run"""
+        key = (url, json.dumps(params, sort_keys=True, default=str))
+        with self.memo_lock:
+            if key in self.memo:
+                count("coalesced")
+                return copy.deepcopy(self.memo[key])
+            future = self.pending.get(key)
+            owner = future is None
+            if owner:
+                future = concurrent.futures.Future()
+                self.pending[key] = future
+                generation = self.generation
+        if not owner:
+            logging.info(f"Waiting on the same request for {url}")
+            count("coalesced")
+            return copy.deepcopy(future.result())
+
+        try:
+            results = self.fetch('GET', url, params)
+        except BaseException as e:
+            with self.memo_lock:
+                del self.pending[key]
+            future.set_exception(e)
+            raise
+        with self.memo_lock:
+            del self.pending[key]
+            # don't remember it if something was written while it was in
+            # flight since it may already be out of date
+            if generation == self.generation:
+                self.memo[key] = results
+        future.set_result(results)
+        return copy.deepcopy(results)
+
+    def forget(self, url):
+        """drop the remembered GET results affected by a write to the url"""
+        path = urllib.parse.urlparse(url).path.rstrip('/')
+        parent = path.rsplit('/', 1)[0]
+        with self.memo_lock:
+            self.generation += 1
+            for key in list(self.memo):
+                memo_path = urllib.parse.urlparse(key[0]).path.rstrip('/')
+                if memo_path in (path, parent) or memo_path.startswith(path + '/'):
+                    del self.memo[key]
+
+    def fetch(self, method, req_url, params, data=None):
+        """send the request and decode the response, collecting every page of
+        a paginated one"""
+        resp = self.send(method, req_url, params, data)
+        self.check(resp)
+        if 'next' not in resp.links:
+            # not paginated
+            results = self.decode(resp)
+            if 'errors' in results:
+                for err in results['errors']:
+                    if isinstance(err, dict):
+                        logging.error("Canvas Error: " + err.get('message'))
+                    else:
+                        logging.error("Canvas Error: " + str(err))
+            return results
+
+        results = []
+        with tqdm(total=page_number(resp.links.get('last'))) as progress_bar:
+            for page in self.paginate(resp, method, data):
+                results += page
+                progress_bar.update()
+        return results
+
+    def iter_get(self, path, params=None, dry_run=False):
+        """Like a GET with request() for a list of things, but yields each item
+        as soon as its page arrives rather than collecting every page first"""
+        if not path.startswith("/"):
+            raise ValueError('request path must start with /')
+        req_url = self.url(path)
+        params = dict(params or {})
+        params.setdefault('per_page', PER_PAGE)
+        logging.info(f"GET {req_url}")
+        logging.debug(f"Params: {params}")
+
+        if dry_run:
+            print("DRYRUN - making request (use --api or --api-dump for more details)")
+            return
+
+        resp = self.send('GET', req_url, params)
+        self.check(resp)
+        for page in self.paginate(resp, 'GET'):
+            if isinstance(page, dict):
+                # not a list, probably an error
+                for err in page.get('errors', []):
+                    logging.error("Canvas Error: " + str(err))
+                return
+            yield from page
+
+    def paginate(self, resp, method, data=None):
+        """Yield the contents of each page of a paginated response in order,
+        starting with the given response.
+
+        When canvas says how many pages there are, the remaining pages are
+        requested at the same time. Otherwise (e.g., canvas sometimes uses
+        opaque bookmarks instead of page numbers) the next links are followed
+        one at a time.
+        https://canvas.instructure.com/doc/api/file.pagination.html"""
+        yield self.decode(resp)
+
+        next_page = page_number(resp.links.get('next'))
+        last_page = page_number(resp.links.get('last'))
+        if next_page is None or last_page is None:
+            while 'next' in resp.links:
+                resp = self.send(method, resp.links['next']['url'], data=data)
+                self.check(resp)
+                yield self.decode(resp)
+            return
+
+        # the links already include the original query parameters
+        urls = [page_url(resp.links['last']['url'], page)
+                for page in range(next_page, last_page+1)]
+        workers = min(self.limiter.max_in_flight, len(urls))
+        with concurrent.futures.ThreadPoolExecutor(max_workers=workers) as pool:
+            futures = [pool.submit(self.send, method, url, None, data) for url in urls]
+            try:
+                for future in futures:
+                    resp = future.result()
+                    self.check(resp)
+                    yield self.decode(resp)
+            finally:
+                for future in futures:
+                    future.cancel()
+
+    def check(self, resp):
+        if resp.status_code in [400, 404, 500]:
+            _failures.n = failures() + 1
+        if resp.status_code == 500:
+            logging.error("Canvas did not like that request. Perhaps the component"
+                    " you are trying to push was incorrectly formatted. A common "
+                    "mistake is having a typo in the yaml. It might help to "
+                    "inspect the request parameters with the --api-dump flag.")
+        if resp.status_code not in [200, 201, 204, 400, 404, 500]:
+            raise requests.HTTPError("Received unexpected status: {}".format(resp.status_code))
+
+    def decode(self, resp):
+        if 'application/json' not in resp.headers.get('content-type', ''):
+            return []
+        r = loads(resp.content)
+        log_json("", r)
+        return r
+
+def page_number(link):
+    """the page number of a pagination link, None if it doesn't have one"""
+    if not link:
+        return None
+    query = urllib.parse.parse_qs(urllib.parse.urlparse(link['url']).query)
+    page = query.get('page', [''])[0]
+    if page.isdigit():
+        return int(page)
+    return None
+
+def page_url(url, page):
+    """the given pagination link pointed at a different page"""
+    parsed = urllib.parse.urlparse(url)
+    query = urllib.parse.parse_qs(parsed.query, keep_blank_values=True)
+    query['page'] = [str(page)]
+    return parsed._replace(query=urllib.parse.urlencode(query, doseq=True)).geturl()
+
+def get_client():
+    """return the shared Client, creating it (and loading the config) on first
+    use"""
+    global _client
+    if _client is None:
+        with _client_lock:
+            if _client is None:
+                response_cache = None
+                # only cache from the root of a course directory (see
+                # helpers.load_db)
+                if _use_cache and os.path.isfile(helpers.DB_FILE):
+                    response_cache = cache.ResponseCache()
+                _client = Client(helpers.Config(), _pool_size, response_cache)
+    return _client
+
+def set_pool_size(size):
+    """size the connection pool for the number of requests that may be in
+    flight at once (e.g., one per push worker)"""
+    global _pool_size
+    size = max(size, POOL_SIZE)
+    if size != _pool_size:
+        _pool_size = size
+        reset_client()
+
+def set_cache(enabled):
+    """turn the on-disk response cache on or off (--no-cache)"""
+    global _use_cache
+    if enabled != _use_cache:
+        _use_cache = enabled
+        reset_client()
+
+def reset_client():
+    """drop the shared Client so the next request reloads the config (e.g.,
+    after logging in with a new token)"""
+    global _client
+    with _client_lock:
+        if _client is not None:
+            _client.session.close()
+        _client = None
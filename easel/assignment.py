@@ -1,5 +1,4 @@
 import json
-import tinydb
 from tqdm import tqdm
 
 from easel import assignment_group as assignment_group_ # see comment below on self.assignment_group
@@ -8,6 +7,7 @@ from easel import component
 from easel import course
 from easel import helpers
 from easel import helpers_yaml
+from easel import parallel
 
 ASSIGNMENTS_PATH=course.COURSE_PATH+"/assignments"
 ASSIGNMENT_PATH=ASSIGNMENTS_PATH+"/{}"
@@ -67,13 +67,10 @@ class Assignment(component.Component):
 
     def get_assignment_group_id(self, db, course_id):
         if self.assignment_group:
-            ags = db.table(assignment_group_.ASSIGN_GROUPS_TABLE)
-            results = ags.search(tinydb.Query().name == self.assignment_group)
-            if not results:
+            group = assignment_group_.find_by_name(db, self.assignment_group)
+            if group is None:
                 raise ValueError(f"failed to find AssignmentGroup called '{self.assignment_group}'")
-            # assumes assignment group names will be unique
-            fname = assignment_group_.AssignmentGroup(**dict(results[0])).filename
-            cid = canvas_id.CanvasID(fname, course_id)
+            cid = canvas_id.CanvasID(group.filename, course_id)
             cid.find_id(db)
             self.assignment_group_id = cid.canvas_id
 
@@ -171,17 +168,15 @@ def pull(db, course_, assignment_id, dry_run):
 
     return Assignment.build(a), cid
 
-def pull_all(db, course_, dry_run):
-    r = helpers.get(ASSIGNMENTS_PATH.format(course_.canvas_id),
+def pull_all(db, course_, dry_run, jobs=1):
+    r = helpers.iter_get(ASSIGNMENTS_PATH.format(course_.canvas_id),
             dry_run=dry_run)
-    assignments = []
+    # skip quizzes (handle in quiz.py)
+    assignment_ids = (a.get('id') for a in r if not a.get("is_quiz_assignment"))
     print("pulling assignment contents")
-    for assignment in tqdm(r):
-        # skip quizzes (handle in quiz.py)
-        if assignment.get("is_quiz_assignment"):
-            continue
-
-        assignment_, _ = pull(db, course_, assignment.get('id'), dry_run)
+    # pull each assignment while the rest of the list is still arriving
+    pulled = parallel.imap(lambda id_: pull(db, course_, id_, dry_run)[0],
+            assignment_ids, jobs)
+    for assignment_ in tqdm(pulled):
         if assignment_:
-            assignments.append(assignment_)
-    return assignments
+            yield assignment_
@@ -32,10 +32,16 @@ class AssignmentGroup(component.Component):
         component.filter_fields(fields, desired_fields)
         return AssignmentGroup(**fields)
 
-def pull_all(db, course_, dry_run):
-    r = helpers.get(ASSIGN_GROUPS_PATH.format(course_.canvas_id),
+def find_by_name(db, name):
+    """the assignment group with the given name, None if there isn't one"""
+    records = component.get_records(db, ASSIGN_GROUPS_TABLE).by_name.get(name)
+    if records:
+        # assumes assignment group names will be unique
+        return AssignmentGroup(**dict(records[0]))
+
+def pull_all(db, course_, dry_run, jobs=1):
+    r = helpers.iter_get(ASSIGN_GROUPS_PATH.format(course_.canvas_id),
             dry_run=dry_run)
-    ags = []
     for ag in tqdm(r):
         cid = canvas_id.find_by_id(db, course_.canvas_id, ag.get('id'))
         if cid:
@@ -47,8 +53,7 @@ def pull_all(db, course_, dry_run):
             cid.save(db)
         new_ag = AssignmentGroup.build(ag)
         new_ag.save(db)
-        ags.append(new_ag)
-    return ags
+        yield new_ag
 
 # Needed for custom yaml tag
 def constructor(loader, node):
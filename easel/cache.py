@@ -0,0 +1,138 @@
+import hashlib
+import json
+import logging
+import os
+import os.path
+import shutil
+import threading
+import urllib.parse
+
+import requests
+
+CACHE_DIR=".easelcache"
+
+class ResponseCache:
+    """An on-disk cache of canvas api GET responses.
+
+    Entries are kept in a directory tree that mirrors the url paths, e.g., the
+    response to GET /api/v1/courses/1/pages?page=2 is saved in
+    .easelcache/<hostname>/api/v1/courses/1/pages/<hash>.json where the hash
+    covers the method, url and params. Each entry holds the response body
+    along with its ETag and Last-Modified headers so that the next GET can ask
+    canvas whether it has changed (If-None-Match, If-Modified-Since). When it
+    hasn't, canvas answers 304 Not Modified without a body and the saved
+    response is used instead.
+
+    A PUT, POST or DELETE to a path drops everything saved under that path as
+    well as the responses for its parent (which is usually the listing the
+    component shows up in)."""
+
+    def __init__(self, directory=CACHE_DIR):
+        self.directory = directory
+
+    def __repr__(self):
+        return f"ResponseCache(directory={self.directory})"
+
+    def path_dir(self, url):
+        parsed = urllib.parse.urlparse(url)
+        parts = [p for p in parsed.path.split('/') if p and p not in ('.', '..')]
+        return os.path.join(self.directory, parsed.netloc, *parts)
+
+    def entry_path(self, method, url, params=None):
+        key = json.dumps([method, url, params or {}], sort_keys=True, default=str)
+        digest = hashlib.sha1(key.encode()).hexdigest()
+        return os.path.join(self.path_dir(url), digest + ".json")
+
+    def load(self, method, url, params=None):
+        """the saved entry for the request, None if there isn't one"""
+        try:
+            with open(self.entry_path(method, url, params)) as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def revalidate_headers(self, entry):
+        """the headers asking canvas whether the saved response is stale"""
+        headers = {}
+        if entry.get('etag'):
+            headers['If-None-Match'] = entry['etag']
+        if entry.get('last_modified'):
+            headers['If-Modified-Since'] = entry['last_modified']
+        return headers
+
+    def save(self, method, url, params, resp):
+        """save a successful response if canvas gave us a way to revalidate
+        it"""
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        if resp.status_code != 200 or not (etag or last_modified):
+            return
+        entry = {
+            'url': url,
+            'etag': etag,
+            'last_modified': last_modified,
+            'headers': {k: v for k, v in resp.headers.items()
+                if k.lower() in ('content-type', 'link')},
+            'body': resp.content.decode('utf-8', errors='replace'),
+        }
+        self.write(method, url, params, entry)
+
+    def refresh(self, method, url, params, entry, resp):
+        """update the saved entry with the headers canvas sent along with a
+        304 (RFC 9111 section 4.3.4), e.g., the Link header changes when items
+        are added to a paginated listing without changing its first page"""
+        etag = resp.headers.get('ETag')
+        last_modified = resp.headers.get('Last-Modified')
+        link = resp.headers.get('Link')
+        if not (etag or last_modified or link):
+            return entry
+        entry = dict(entry)
+        if etag:
+            entry['etag'] = etag
+        if last_modified:
+            entry['last_modified'] = last_modified
+        if link:
+            entry['headers'] = {k: v for k, v in entry['headers'].items()
+                if k.lower() != 'link'}
+            entry['headers']['Link'] = link
+        self.write(method, url, params, entry)
+        return entry
+
+    def write(self, method, url, params, entry):
+        path = self.entry_path(method, url, params)
+        try:
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            # write to a temporary file first so that other threads never read
+            # half of an entry
+            tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+            with open(tmp_path, 'w') as f:
+                json.dump(entry, f)
+            os.replace(tmp_path, path)
+        except OSError as e:
+            logging.info(f"Could not cache response for {url}: {e}")
+
+    def response(self, entry, url):
+        """rebuild the saved response"""
+        resp = requests.Response()
+        resp.status_code = 200
+        resp.url = url
+        resp.headers.update(entry['headers'])
+        resp._content = entry['body'].encode('utf-8')
+        resp.encoding = 'utf-8'
+        return resp
+
+    def invalidate(self, url):
+        """drop the saved responses affected by a write to the url"""
+        path = self.path_dir(url)
+        shutil.rmtree(path, ignore_errors=True)
+        parent = os.path.dirname(path)
+        try:
+            filenames = os.listdir(parent)
+        except OSError:
+            return
+        for filename in filenames:
+            if filename.endswith(".json"):
+                try:
+                    os.remove(os.path.join(parent, filename))
+                except OSError:
+                    pass
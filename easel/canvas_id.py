@@ -1,13 +1,111 @@
+import bisect
+import weakref
+
 import tinydb
 
+from easel import storage
+
 TABLE="canvas_ids"
 
+# the Index of each open db
+_indexes = weakref.WeakKeyDictionary()
+
+class Index:
+    """The canvas_ids table of a db kept in memory.
+
+    It's read from the db the first time it's needed and then kept up to date
+    by CanvasID.save and CanvasID.remove, so finding a component's canvas id
+    (which happens several times per component when pushing) doesn't search
+    the whole table. The records are kept in the same order as in the table
+    so that the results match what searching the table would give.
+
+    The filenames of each course are also kept sorted so that the children of
+    a component (named {parent_filename}--{child}, see
+    helpers.make_nested_filename) are next to each other and can be found
+    with a binary search."""
+
+    def __init__(self, records):
+        self.by_course = {} # course_id -> {filename -> record}
+        self.by_id = {} # (course_id, canvas_id) -> {filename -> record}
+        self.filenames = {} # course_id -> sorted filenames
+        for record in records:
+            self.add(dict(record), replace=False)
+
+    def __repr__(self):
+        return f"Index(courses={len(self.by_course)}, ids={len(self.by_id)})"
+
+    def find(self, course_id, filename):
+        return self.by_course.get(course_id, {}).get(filename)
+
+    def find_by_id(self, course_id, canvas_id):
+        records = self.by_id.get((course_id, canvas_id))
+        if records:
+            return next(iter(records.values()))
+
+    def course_records(self, course_id):
+        return list(self.by_course.get(course_id, {}).values())
+
+    def prefix_records(self, course_id, prefix):
+        """the records of the course whose filename starts with prefix, in
+        filename order"""
+        filenames = self.filenames.get(course_id, [])
+        records = self.by_course.get(course_id, {})
+        found = []
+        i = bisect.bisect_left(filenames, prefix)
+        while i < len(filenames) and filenames[i].startswith(prefix):
+            found.append(records[filenames[i]])
+            i += 1
+        return found
+
+    def add(self, record, replace=True):
+        course_id = record.get('course_id')
+        filename = record.get('filename')
+        records = self.by_course.setdefault(course_id, {})
+        old = records.get(filename)
+        if old is not None:
+            if not replace:
+                # a duplicate, searching the table finds the first one
+                return
+            key = (course_id, old.get('canvas_id'))
+            self.by_id.get(key, {}).pop(filename, None)
+            if not self.by_id.get(key, True):
+                del self.by_id[key]
+        elif isinstance(filename, str):
+            bisect.insort(self.filenames.setdefault(course_id, []), filename)
+        # replacing the record keeps its place like upserting it in the table
+        records[filename] = record
+        self.by_id.setdefault((course_id, record.get('canvas_id')), {})[filename] = record
+
+    def discard(self, course_id, filename):
+        record = self.by_course.get(course_id, {}).pop(filename, None)
+        if record is None:
+            return
+        if isinstance(filename, str):
+            filenames = self.filenames[course_id]
+            del filenames[bisect.bisect_left(filenames, filename)]
+        key = (course_id, record.get('canvas_id'))
+        records = self.by_id.get(key, {})
+        records.pop(filename, None)
+        if not records:
+            self.by_id.pop(key, None)
+
+def get_index(db):
+    with storage.LOCK:
+        index = _indexes.get(db)
+        if index is None:
+            index = Index(db.table(TABLE).all())
+            _indexes[db] = index
+        return index
+
 class CanvasID:
 
-    def __init__(self, filename="", course_id="", canvas_id=""):
+    def __init__(self, filename="", course_id="", canvas_id="", content_hash=""):
         self.filename = filename
         self.course_id = course_id
         self.canvas_id = canvas_id
+        # a hash of what was last pushed for the component (see
+        # Component.push), empty if it isn't known
+        self.content_hash = content_hash
 
     def __repr__(self):
         return f"CanvasID(filename={self.filename}, course_id={self.course_id}, canvas_id={self.canvas_id})"
@@ -15,11 +113,11 @@ class CanvasID:
     def find_id(self, db):
         """search for a component's canvas id using its filename and course,
         None if not found"""
-        table = db.table(TABLE)
-        results = table.search(self.gen_query())
         # assume a component will only have a single canvas_id per course
-        if len(results) > 0:
-            self.canvas_id = results[0]['canvas_id']
+        record = get_index(db).find(self.course_id, self.filename)
+        if record is not None:
+            self.canvas_id = record['canvas_id']
+            self.content_hash = record.get('content_hash', "")
 
     def gen_query(self):
         CID = tinydb.Query()
@@ -27,31 +125,29 @@ class CanvasID:
 
     def save(self, db):
         table = db.table(TABLE)
-        table.upsert(vars(self), self.gen_query())
+        with storage.LOCK:
+            table.upsert(vars(self), self.gen_query())
+            get_index(db).add(dict(vars(self)))
 
     def remove(self, db):
         table = db.table(TABLE)
-        table.remove(self.gen_query())
+        with storage.LOCK:
+            table.remove(self.gen_query())
+            get_index(db).discard(self.course_id, self.filename)
 
 def find_by_id(db, course_id, id_):
-    table = db.table(TABLE)
-    CID = tinydb.Query()
-    result = table.get((CID.course_id == course_id) & (CID.canvas_id == id_))
+    result = get_index(db).find_by_id(course_id, id_)
     if result:
         return CanvasID(**result)
 
 def find_by_prefix(db, course_id, prefix):
-    table = db.table(TABLE)
-    CID = tinydb.Query()
-    results = table.search((CID.filename.matches("^"+prefix)) & (CID.course_id == course_id))
+    # found up front since the caller may remove them as it goes
+    results = get_index(db).prefix_records(course_id, prefix)
     for result in results:
         if result:
             yield CanvasID(**result)
 
 def find_all_course_components(db, course_id):
-    table = db.table(TABLE)
-    CID = tinydb.Query()
-    results = table.search(CID.course_id == course_id)
-    for result in results:
+    for result in get_index(db).course_records(course_id):
         if result:
             yield CanvasID(**result)
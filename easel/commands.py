@@ -1,15 +1,24 @@
+import copy
+import functools
 import getpass
 import importlib
 import logging
 import os.path
 import sys
 
+from easel import api
 from easel import canvas_id
+from easel import component
 from easel import course
 from easel import files
 from easel import helpers
 from easel import helpers_yaml
+from easel import journal
 from easel import navigation_tab
+from easel import parallel
+from easel import planner
+from easel import sqlite_db
+from easel import storage
 
 def cmd_login(db, args):
     hostname = args.hostname
@@ -101,6 +110,152 @@ def cmd_course_publish(db, args):
     for course_ in args.course:
         course.publish(course_.canvas_id, args.dry_run)
 
+def cmd_db(db, args):
+    if args.subcommand == "migrate":
+        cmd_db_migrate(db, args.subcommand_argument or "sqlite", args.dry_run)
+    elif args.subcommand == "compact":
+        cmd_db_compact(db, args.dry_run)
+    elif args.subcommand == "verify":
+        cmd_db_verify(db, args.prune, args.dry_run)
+
+def cmd_db_migrate(db, db_format, dry_run):
+    current = helpers.db_format()
+    if db_format == current:
+        print(f"{helpers.DB_FILE} is already stored as {db_format}")
+        return
+    if db_format != "sqlite" and db_format not in storage.FORMATS:
+        print(f"unknown db format {db_format}, choose from sqlite, "
+                f"{', '.join(storage.FORMATS)}")
+        sys.exit(1)
+    if dry_run:
+        print(f"DRYRUN - migrating {helpers.DB_FILE} to {db_format}")
+        return
+    backup_path = f"{helpers.DB_FILE}.{current}"
+    if db_format == "sqlite":
+        sqlite_db.migrate(db, helpers.DB_FILE, backup_path)
+    else:
+        storage.migrate(db, helpers.DB_FILE, storage.FORMATS[db_format],
+                backup_path, **helpers.JSON_FORMAT)
+    print(f"migrated {helpers.DB_FILE} to {db_format} (the old version is in "
+            f"{backup_path})")
+
+def is_orphan(filename):
+    """whether none of the files a db row may belong to exist anymore. The
+    row of a nested component (e.g., a module item) is named after its parent
+    (see helpers.make_nested_filename)."""
+    parts = filename.split("--")
+    return not any(os.path.exists("--".join(parts[:i]))
+            for i in range(1, len(parts)+1))
+
+def cmd_db_compact(db, dry_run):
+    """drop the rows of the db that easel no longer needs: rows of courses
+    that were removed, rows of components whose files were deleted, and
+    duplicates"""
+    course_ids = {course_.canvas_id for course_ in course.find_all(db)}
+    for name in sorted(db.tables()):
+        table = db.table(name)
+        seen = set()
+        orphans = []
+        for document in table.all():
+            key = storage.merge_key(name, document)
+            filename = document.get('filename')
+            if key in seen:
+                orphans.append(document.doc_id)
+            elif name == canvas_id.TABLE and document.get('course_id') not in course_ids:
+                orphans.append(document.doc_id)
+            elif isinstance(filename, str) and is_orphan(filename):
+                orphans.append(document.doc_id)
+            seen.add(key)
+        if not orphans:
+            continue
+        if dry_run:
+            print(f"DRYRUN - dropping {len(orphans)} rows from {name}")
+        else:
+            print(f"dropping {len(orphans)} rows from {name}")
+            table.remove(doc_ids=orphans)
+    if not dry_run:
+        db.compact()
+
+# the list endpoint of each kind of component that has canvas ids and the field
+# of the listed items that the canvas_ids table holds, by directory. modules
+# are listed with their items so that module items are checked too.
+VERIFY_LISTS = {
+        "assignment_groups": ("assignment_group", "ASSIGN_GROUPS_PATH", "id"),
+        "assignments": ("assignment", "ASSIGNMENTS_PATH", "id"),
+        "external_tools": ("external_tool", "EXT_TOOLS_PATH", "id"),
+        "files": ("files", "COURSE_FILES_PATH", "id"),
+        "modules": ("module", "MODULES_PATH", "id"),
+        "pages": ("page", "PAGES_PATH", "url"),
+        "quizzes": ("quiz", "QUIZZES_PATH", "id"),
+        }
+
+def list_canvas_ids(course_id, directory):
+    """the canvas ids of every component of a kind in a course, found with a
+    single (paginated) list request, None if canvas didn't give us the list.
+    module items are included as {module id}/{item id}."""
+    module_name, path_name, field = VERIFY_LISTS[directory]
+    m = importlib.import_module("easel."+module_name)
+    path = getattr(m, path_name).format(course_id)
+    params = {'include': ['items']} if directory == "modules" else {}
+    r = helpers.get(path, params)
+    if not isinstance(r, list):
+        logging.error(f"Could not list the {directory} of course "
+                f"{course_id}: {r}")
+        return None
+    ids = {str(item.get(field)) for item in r}
+    if directory == "modules":
+        items_path = m.MODULE_PATH + "/items"
+        for module_ in r:
+            items = module_.get('items')
+            if items is None:
+                # canvas leaves the items out of modules with lots of them
+                items = helpers.get(items_path.format(course_id, module_['id']))
+            if isinstance(items, list):
+                ids |= {f"{module_['id']}/{item.get('id')}" for item in items}
+    return ids
+
+def cmd_db_verify(db, prune, dry_run):
+    """check the canvas_ids table against what's actually in canvas and
+    report (or, with prune, drop) the rows of components that were deleted
+    there. the list requests only read from canvas so they're made even for a
+    dry run."""
+    index = canvas_id.get_index(db)
+    for course_ in course.find_all(db):
+        by_directory = {}
+        for cid in canvas_id.find_all_course_components(db, course_.canvas_id):
+            directory = cid.filename.split("/")[0]
+            if directory in VERIFY_LISTS:
+                by_directory.setdefault(directory, []).append(cid)
+
+        stale = []
+        for directory in sorted(by_directory):
+            ids = list_canvas_ids(course_.canvas_id, directory)
+            if ids is None:
+                continue
+            for cid in by_directory[directory]:
+                key = str(cid.canvas_id)
+                if directory == "modules" and "--" in cid.filename:
+                    # a module item, its id is only unique within its module
+                    parent = index.find(course_.canvas_id,
+                            cid.filename.split("--")[0])
+                    if parent is not None:
+                        key = f"{parent['canvas_id']}/{cid.canvas_id}"
+                    else:
+                        key = None
+                if key not in ids:
+                    stale.append(cid)
+
+        print(f"{len(stale)} stale canvas ids in {course_.name} "
+                f"({course_.canvas_id})")
+        for cid in stale:
+            if not prune:
+                print(f"  {cid.filename} ({cid.canvas_id}) is not in canvas")
+            elif dry_run:
+                print(f"  DRYRUN - dropping {cid.filename} ({cid.canvas_id})")
+            else:
+                print(f"  dropping {cid.filename} ({cid.canvas_id})")
+                cid.remove(db)
+
 def cmd_remove(db, args):
     if not args.components:
         # remove everything
@@ -125,22 +280,22 @@ def cmd_remove(db, args):
 
             for child_path in os.listdir(component_filepath):
                 full_child_path = component_filepath + '/' + child_path
-                component = helpers_yaml.read(full_child_path)
-                if component and not isinstance(component, str):
-                    component.filename = full_child_path
+                component_ = helpers_yaml.read(full_child_path)
+                if component_ and not isinstance(component_, str):
+                    component_.filename = full_child_path
                     for course_ in args.course:
-                        print(f"removing {component} from {course_.name} ({course_.canvas_id})")
-                        component.remove(db, course_, args.dry_run)
+                        print(f"removing {component_} from {course_.name} ({course_.canvas_id})")
+                        component_.remove(db, course_, args.dry_run)
         else:
             for course_ in args.course:
                 if component_filepath == "syllabus.md":
                     logging.error("Don't remove your syllabus!")
                 else:
-                    component = helpers_yaml.read(component_filepath)
-                    if component and not isinstance(component, str):
-                        component.filename = component_filepath
-                        print(f"removing {component} from {course_.name} ({course_.canvas_id})")
-                        component.remove(db, course_, args.dry_run)
+                    component_ = helpers_yaml.read(component_filepath)
+                    if component_ and not isinstance(component_, str):
+                        component_.filename = component_filepath
+                        print(f"removing {component_} from {course_.name} ({course_.canvas_id})")
+                        component_.remove(db, course_, args.dry_run)
                     else:
                         # not a yaml file so assume it's a file/dir to remove
                         files.remove(db, course_, component_filepath, args.dry_run)
@@ -156,6 +311,7 @@ def cmd_pull(db, args):
     else:
         args.course = course.match_courses(db, args.course)
 
+    api.set_pool_size(args.jobs)
     for component_filepath in args.components:
         local = {}
         remote = {}
@@ -173,30 +329,33 @@ def cmd_pull(db, args):
             # local versions
             for child_path in os.listdir(component_filepath):
                 if not component_filepath.startswith("files"):
-                    component = helpers_yaml.read(component_filepath + '/' +
+                    component_ = helpers_yaml.read(component_filepath + '/' +
                             child_path)
-                    local[component.filename] = component
+                    local[component_.filename] = component_
 
             # request remote versions
             for course_ in args.course:
                 m = importlib.import_module("easel."+helpers.DIRS[component_filepath])
                 print(f"pulling all {component_filepath} from {course_.name} ({course_.canvas_id})")
-                for remote_comp in m.pull_all(db, course_, args.dry_run):
-                    if remote_comp.filename in remote:
+                for remote_comp in m.pull_all(db, course_, args.dry_run, args.jobs):
+                    if len(args.course) == 1:
+                        # nothing to merge so write each one as it arrives
+                        write_pulled(local, [remote_comp])
+                    elif remote_comp.filename in remote:
                         remote[remote_comp.filename].append(remote_comp)
                     else:
                         remote[remote_comp.filename] = [remote_comp]
 
         elif os.path.isfile(component_filepath):
             # local version
-            component = helpers_yaml.read(component_filepath)
-            component.filename = component_filepath
-            local[component.filename] = component
+            component_ = helpers_yaml.read(component_filepath)
+            component_.filename = component_filepath
+            local[component_.filename] = component_
 
             # request remote version(s)
             for course_ in args.course:
-                print(f"pulling {component} from {course_.name} ({course_.canvas_id})")
-                remote_comp = component.pull(db, course_, args.dry_run)
+                print(f"pulling {component_} from {course_.name} ({course_.canvas_id})")
+                remote_comp = component_.pull(db, course_, args.dry_run)
                 if remote_comp.filename in remote:
                     remote[remote_comp.filename].append(remote_comp)
                 else:
@@ -208,8 +367,8 @@ def cmd_pull(db, args):
             # clause will take care of it.
             for course_ in args.course:
                 print(f"pulling navigation tabs from {course_.name} ({course_.canvas_id})")
-                component = navigation_tab.NavigationTabs()
-                remote_comp = component.pull(db, course_, args.dry_run)
+                component_ = navigation_tab.NavigationTabs()
+                remote_comp = component_.pull(db, course_, args.dry_run)
                 if remote_comp.filename in remote:
                     remote[remote_comp.filename].append(remote_comp)
                 else:
@@ -220,19 +379,21 @@ def cmd_pull(db, args):
 
         # TODO: merge remote into local
         for remote_comp in remote:
-            components = remote[remote_comp]
-            if remote_comp in local:
-                logging.warn("Overwriting local copy of "
-                        "{components[0].filename}. In the future, we'll "
-                        "implement a merge workflow")
-            if len(remote[remote_comp]) == 1:
-                print(f"writing {components[0]} to {components[0].filename}")
-                helpers_yaml.write(components[0].filename, components[0])
-            else:
-                logging.error("Too many remote options to handle right now..."
-                        "Please manually specify a single course to pull from "
-                        "with the -c flag and later we'll implement a merge "
-                        "workflow")
+            write_pulled(local, remote[remote_comp])
+
+def write_pulled(local, components):
+    """write the remote version(s) of a component pulled from canvas"""
+    if components[0].filename in local:
+        logging.warn(f"Overwriting local copy of {components[0].filename}. "
+                "In the future, we'll implement a merge workflow")
+    if len(components) == 1:
+        print(f"writing {components[0]} to {components[0].filename}")
+        helpers_yaml.write(components[0].filename, components[0])
+    else:
+        logging.error("Too many remote options to handle right now..."
+                "Please manually specify a single course to pull from "
+                "with the -c flag and later we'll implement a merge "
+                "workflow")
 
 def cmd_push(db, args):
     if not args.components:
@@ -246,69 +407,110 @@ def cmd_push(db, args):
     else:
         args.course = course.match_courses(db, args.course)
 
+    api.set_pool_size(args.jobs)
+    component.set_force(args.force)
+
+    plan = planner.Plan()
     for component_filepath in args.components:
         if component_filepath.endswith("*"):
             component_filepath = component_filepath[:-1]
         if component_filepath.endswith("/"):
             component_filepath = component_filepath[:-1]
-
-        if os.path.isdir(component_filepath) and not component_filepath.startswith("files"):
-            if component_filepath not in helpers.DIRS:
-                logging.error("Invalid directory: "+component_filepath)
-                continue
-
-            for child_path in os.listdir(component_filepath):
-                full_child_path = component_filepath + '/' + child_path
-                component = helpers_yaml.read(full_child_path)
-                if component and not isinstance(component, str):
-                    component.filename = full_child_path
-                    for course_ in args.course:
-                        print(f"pushing {component} to {course_.name} ({course_.canvas_id})")
-                        component.push(db, course_, args.dry_run)
-
-        elif component_filepath.startswith("files"):
-            for course_ in args.course:
-                files.push(db, course_, component_filepath, args.hidden,
-                        args.dry_run)
-        else:
-            if not os.path.isfile(component_filepath):
-                logging.error("Cannot find file: " + component_filepath)
+        plan.add(component_filepath)
+
+    journal_ = journal.Journal()
+    if not args.dry_run:
+        journal_.start(args.resume)
+
+    # the components in a wave only depend on those in earlier waves so they
+    # can be pushed concurrently
+    for wave in plan.waves():
+        tasks = []
+        modules = []
+        for node in wave:
+            if type(node.component).__name__ == "Module":
+                modules.append(node)
                 continue
-
             for course_ in args.course:
-                if component_filepath == "syllabus.md":
-                    print(f"pushing syllabus to {course_.name} ({course_.canvas_id})")
-                    course.push_syllabus(db, course_.canvas_id, args.dry_run)
-                elif component_filepath == "grading_scheme.yaml":
-                    print(f"pushing grading scheme to {course_.name} ({course_.canvas_id})")
-                    cid = canvas_id.CanvasID(component_filepath, course_.canvas_id)
-                    cid.find_id(db)
-                    if cid.canvas_id == "":
-                        # Don't try to create a scheme if it doesn't already
-                        # exist. Ideally, we update the scheme but Canvas
-                        # apparently doesn't allow for that.
-                        component = helpers_yaml.read(component_filepath)
-                        component.push(db, course_, args.dry_run)
-                        cid.find_id(db)
-                    course.update_grading_scheme(db, course_.canvas_id,
-                            cid.canvas_id, args.dry_run)
-                elif component_filepath == "navigation.yaml":
-                    print(f"pushing navigation tabs to {course_.name} ({course_.canvas_id})")
-                    navigation_tab.push(db, course_, args.dry_run)
-                elif component_filepath == "course.yaml":
-                    print(f"updating course settings for {course_.name} ({course_.canvas_id})")
-                    settings = helpers_yaml.read("course.yaml")
-                    course.update_settings(db, course_.canvas_id, settings, args.dry_run)
+                if node.upload:
+                    task = functools.partial(files.push, db, course_,
+                        node.filename, args.hidden, args.dry_run)
+                elif node.component:
+                    task = functools.partial(push_components, db, course_,
+                            [node.component], args.dry_run)
                 else:
-                    component = helpers_yaml.read(component_filepath)
-                    if component and not isinstance(component, str):
-                        component.filename = component_filepath
-                        print(f"pushing {component} to {course_.name} ({course_.canvas_id})")
-                        component.push(db, course_, args.dry_run)
-                    else:
-                        # not a yaml file so assume it's a file/dir to upload
-                        files.push(db, course_, component_filepath,
-                                args.hidden, args.dry_run)
+                    task = functools.partial(push_file, db, course_,
+                        node.filename, args.dry_run)
+                tasks.append(journaled(journal_, course_, node, task,
+                    args.dry_run))
+        if modules:
+            # module items push the components they refer to when those aren't
+            # part of this push and don't exist in the course yet, so two
+            # modules could race to create the same component. keep each
+            # course's modules on a single worker.
+            for course_ in args.course:
+                module_tasks = [journaled(journal_, course_, node,
+                    functools.partial(push_components, db, course_,
+                        [node.component], args.dry_run), args.dry_run)
+                    for node in modules]
+                tasks.append(functools.partial(parallel.run, module_tasks))
+        parallel.run(tasks, args.jobs)
+
+    if not args.dry_run:
+        journal_.finish()
+
+def journaled(journal_, course_, node, task, dry_run):
+    """wrap a push task so that it's recorded in the journal when it succeeds
+    and skipped if the journal says it already finished (push --resume)"""
+    def run():
+        content_hash = node.content_hash()
+        if journal_.done(course_.canvas_id, node.filename, content_hash):
+            print(f"skipping {node.filename} for {course_.name} "
+                    f"({course_.canvas_id}), it was already pushed")
+            return
+        failures = api.failures()
+        task()
+        if api.failures() > failures:
+            # canvas rejected part of it, push it again with --resume
+            return
+        if not dry_run:
+            journal_.record(course_.canvas_id, node.filename, content_hash)
+    return run
+
+def push_components(db, course_, components, dry_run):
+    for component_ in components:
+        # pushing modifies the component (e.g., its markdown is converted to
+        # html for this course) so each course gets its own copy
+        component_ = copy.deepcopy(component_)
+        print(f"pushing {component_} to {course_.name} ({course_.canvas_id})")
+        component_.push(db, course_, dry_run)
+
+def push_file(db, course_, component_filepath, dry_run):
+    """push one of the files that are part of the course rather than a
+    component (see planner.COURSE_FILES)"""
+    if component_filepath == "syllabus.md":
+        print(f"pushing syllabus to {course_.name} ({course_.canvas_id})")
+        course.push_syllabus(db, course_.canvas_id, dry_run)
+    elif component_filepath == "grading_scheme.yaml":
+        print(f"pushing grading scheme to {course_.name} ({course_.canvas_id})")
+        cid = canvas_id.CanvasID(component_filepath, course_.canvas_id)
+        cid.find_id(db)
+        if cid.canvas_id == "":
+            # Don't try to create a scheme if it doesn't already
+            # exist. Ideally, we update the scheme but Canvas
+            # apparently doesn't allow for that.
+            component_ = helpers_yaml.read(component_filepath)
+            component_.push(db, course_, dry_run)
+            cid.find_id(db)
+        course.update_grading_scheme(db, course_.canvas_id,
+                cid.canvas_id, dry_run)
+    elif component_filepath == "navigation.yaml":
+        print(f"pushing navigation tabs to {course_.name} ({course_.canvas_id})")
+        navigation_tab.push(db, course_, dry_run)
+    elif component_filepath == "course.yaml":
+        print(f"updating course settings for {course_.name} ({course_.canvas_id})")
+        settings = helpers_yaml.read("course.yaml")
+        course.update_settings(db, course_.canvas_id, settings, dry_run)
 
 def cmd_md(db, args):
     if not args.components:
@@ -329,18 +531,18 @@ def cmd_md(db, args):
             for course_ in courses:
                 for child_path in os.listdir(component_filepath):
                     full_child_path = component_filepath + '/' + child_path
-                    component = helpers_yaml.read(full_child_path)
-                    print(component.md(db, course_))
+                    component_ = helpers_yaml.read(full_child_path)
+                    print(component_.md(db, course_))
         else:
             if component_filepath == "syllabus.md":
                 for course_ in courses:
                     print(course.format_syllabus(db, course_.canvas_id))
             else:
-                component = helpers_yaml.read(component_filepath)
-                if isinstance(component, list):
+                component_ = helpers_yaml.read(component_filepath)
+                if isinstance(component_, list):
                     for course_ in courses:
-                        for obj in component:
+                        for obj in component_:
                             print("\n\n*****\n", obj.md(db, course_))
                 else:
                     for course_ in courses:
-                        print(component.md(db, course_))
+                        print(component_.md(db, course_))
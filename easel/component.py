@@ -1,10 +1,63 @@
+import copy
+import hashlib
+import json
 import logging
+import weakref
+
 import tinydb
-import yaml
 
 from easel import canvas_id
 from easel import course
 from easel import helpers
+from easel import storage
+
+# the Records of each table of each open db
+_records = weakref.WeakKeyDictionary()
+# push components even when they haven't changed (push --force)
+_force = False
+
+class Records:
+    """A component table of a db kept in memory.
+
+    Like canvas_id.Index, it's read from the db the first time it's needed and
+    then kept up to date by Component.save so that finding a component's
+    record (or an assignment group by its name) doesn't search the whole
+    table."""
+
+    def __init__(self, records):
+        self.by_filename = {} # filename -> [record]
+        self.by_name = {} # name -> [record]
+        for record in records:
+            record = dict(record)
+            self.by_filename.setdefault(record.get('filename'), []).append(record)
+            self.by_name.setdefault(record.get('name'), []).append(record)
+
+    def __repr__(self):
+        return f"Records(total={len(self.by_filename)})"
+
+    def upsert(self, fields):
+        """mirror upserting the fields into the table by filename"""
+        filename = fields.get('filename')
+        records = self.by_filename.get(filename)
+        if not records:
+            records = [{}]
+            self.by_filename[filename] = records
+        for record in records:
+            old_name = record.get('name')
+            if old_name in self.by_name:
+                self.by_name[old_name] = [r for r in self.by_name[old_name]
+                        if r is not record]
+                if not self.by_name[old_name]:
+                    del self.by_name[old_name]
+            record.update(fields)
+            self.by_name.setdefault(record.get('name'), []).append(record)
+
+def get_records(db, table_name):
+    with storage.LOCK:
+        tables = _records.setdefault(db, {})
+        if table_name not in tables:
+            tables[table_name] = Records(db.table(table_name).all())
+        return tables[table_name]
 
 class Component:
     """
@@ -64,8 +117,9 @@ class Component:
         return self.update_path.format(*path_args)
 
     def find(self, db):
-        table = db.table(self.table)
-        return table.search(self.gen_query())
+        with storage.LOCK:
+            records = get_records(db, self.table).by_filename.get(self.filename, [])
+            return [dict(record) for record in records]
 
     def get_canvas_id(self, db, course_id):
         cid = canvas_id.CanvasID(self.filename, course_id)
@@ -81,6 +135,17 @@ class Component:
     def postprocess(self, db, course_, dry_run):
         pass
 
+    def hash_fields(self):
+        """what decides whether the component changed since it was last pushed
+        (see content_hash), by default the request body"""
+        return dict(self)
+
+    def postprocess_unchanged(self, db, course_, dry_run):
+        """called instead of postprocess when the component wasn't pushed
+        because it hasn't changed. override this when the component's children
+        (which keep track of their own changes) still need to be pushed."""
+        pass
+
     def remove(self, db, course_, dry_run):
         course_id = course_.canvas_id
         cid = canvas_id.CanvasID(self.filename, course_id)
@@ -125,7 +190,9 @@ class Component:
         c = dict(self.gen_fields())
         c['filename'] = self.filename
         table = db.table(self.table)
-        table.upsert(c, self.gen_query())
+        with storage.LOCK:
+            table.upsert(c, self.gen_query())
+            get_records(db, self.table).upsert(c)
 
     def push(self, db, course_, dry_run, parent_component=None):
         """
@@ -171,6 +238,7 @@ class Component:
             # create
             path = self.format_create_path(db, course_id, parent_component)
             self.preprocess(db, course_, dry_run)
+            cid.content_hash = content_hash(self)
             resp = helpers.post(path, self, dry_run=dry_run)
 
             if dry_run:
@@ -200,6 +268,17 @@ class Component:
 
         else:
             # update
+            # if the local component is the same as last time, canvas already
+            # has this version. it's hashed the same way as when it was
+            # created (rather than after merging it into its db record).
+            local = copy.deepcopy(self)
+            local.preprocess(db, course_, dry_run)
+            new_hash = content_hash(local)
+            if not _force and new_hash == cid.content_hash:
+                print(f"{local} is unchanged in course {course_id}, skipping")
+                local.postprocess_unchanged(db, course_, dry_run)
+                return
+
             if not found:
                 found = self
             elif len(found) > 1:
@@ -229,6 +308,9 @@ class Component:
                 print(f"DRYRUN - saving the component {found}")
             else:
                 found.save(db)
+                if "errors" not in resp:
+                    cid.content_hash = new_hash
+                    cid.save(db)
 
             found.postprocess(db, course_, dry_run)
 
@@ -268,7 +350,19 @@ class Component:
             if key in fields:
                 ordered[key] = fields[key]
 
-        return yaml.dump(ordered, sort_keys=False)
+        from easel import helpers_yaml # import here to prevent circular import
+        return helpers_yaml.dump(ordered, sort_keys=False)
+
+def content_hash(component_):
+    """a hash of a preprocessed component (see Component.hash_fields), used to
+    tell whether it changed since it was last pushed"""
+    data = json.dumps(component_.hash_fields(), sort_keys=True, default=str)
+    return hashlib.sha1(data.encode('utf-8')).hexdigest()
+
+def set_force(enabled):
+    """push components even when they haven't changed since the last push"""
+    global _force
+    _force = enabled
 
 def build(class_name, dictionary):
     from easel import assignment_group
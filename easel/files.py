@@ -1,15 +1,15 @@
-import json
 import logging
 import os
 import os.path
 import urllib.parse
 
-import requests
 from tqdm import tqdm
 
+from easel import api
 from easel import canvas_id
 from easel import course
 from easel import helpers
+from easel import parallel
 
 COURSE_FILES_PATH=course.COURSE_PATH+"/files"
 COURSE_FOLDERS_PATH=course.COURSE_PATH+"/folders"
@@ -62,10 +62,10 @@ def pushfile(db, course_, full_path, hidden, dry_run):
     if dry_run:
         print("DRYRUN - making request (use --api or --api-dump for more details)")
     else:
-        resp = requests.request("POST", req_url, params=params, files=file_)
+        resp = api.get_client().external("POST", req_url, params=params, files=file_)
         if resp.text:
-            r = resp.json()
-            logging.debug(json.dumps(r, sort_keys=True, indent=4))
+            r = api.loads(resp.content)
+            api.log_json("", r)
 
             file_id = r.get('id')
             cid = canvas_id.CanvasID(full_path, course_.canvas_id)
@@ -108,23 +108,29 @@ def pull_file(db, course_id, url, id_, filepath):
     cid.save(db)
     return cid
 
-def pull_all(db, course_, dry_run):
-    r = helpers.get(COURSE_FOLDERS_PATH.format(course_.canvas_id),
+def pull_all(db, course_, dry_run, jobs=1):
+    r = helpers.iter_get(COURSE_FOLDERS_PATH.format(course_.canvas_id),
             dry_run=dry_run)
     for folder in r:
         path = folder['full_name'][len("course "):]
         print(f"pulling list of files in {path}")
         os.makedirs(path, exist_ok=True)
         files_path = urllib.parse.urlparse(folder['files_url']).path
-        r = helpers.get(files_path, dry_run=dry_run)
         print(f"downloading files in {path}")
-        for file_ in tqdm(r):
+
+        def download(file_):
             if 'filename' not in file_ or 'url' not in file_ or 'id' not in file_:
                 logging.error("Invalid file response from canvas:")
                 print(file_)
-                continue
+                return
             filepath = path + '/' + file_['filename']
             pull_file(db, course_.canvas_id, file_['url'], file_['id'], filepath)
+
+        # download each file while the rest of the list is still arriving
+        for _ in tqdm(parallel.imap(download, helpers.iter_get(files_path,
+            dry_run=dry_run), jobs)):
+            pass
+    # the files are written as they're downloaded so there's nothing to merge.
     # normally we'd return a list of file objects for diffing the local ones,
     # but since we don't track files in the db we won't be able to diff
     # anything (in the the way it's done in commands.py)
@@ -1,22 +1,26 @@
+import functools
 import json
-import logging
 import os
 import os.path
 import sys
 from pathlib import Path
 import re
-from tqdm import tqdm
+import string
+import threading
 import urllib.parse
 
 import markdown
-import requests
-import tinydb
 import yaml
 
+from easel import api
 from easel import canvas_id
+from easel import sqlite_db
+from easel import storage
 
 API="/api/v1"
 HTTPS="https://"
+DB_FILE=".easeldb"
+JSON_FORMAT = {'sort_keys': True, 'indent': 4, 'separators': (',', ': ')}
 DIRS = { # maps a directory name to its easel module name
         "assignment_groups": "assignment_group",
         "assignments": "assignment",
@@ -93,20 +97,119 @@ def filter_canvas_html(html):
             html = html.replace(st, '')
     return html
 
-def md2html(mdtext, args={}):
-    extensions = ['fenced_code', 'codehilite', 'tables', 'attr_list', 'md_in_html']
-    config = {'codehilite': {'noclasses': True}}
+MD_EXTENSIONS = ['fenced_code', 'codehilite', 'tables', 'attr_list', 'md_in_html']
+MD_CONFIG = {'codehilite': {'noclasses': True}}
+MD_CACHE_SIZE = 4096
+FILES_LINK = re.compile(r'\{files/[^}]+\}')
+# stands in for a template field while the markdown is converted (see
+# render_template)
+PLACEHOLDER_PREFIX = "easelfield"
+PLACEHOLDER = PLACEHOLDER_PREFIX + "{}x"
+PLACEHOLDER_RE = re.compile(PLACEHOLDER_PREFIX + r"(\d+)x")
+# template field values that come out of markdown exactly as they went in and
+# don't change how the markdown around them is converted: no markdown or html
+# characters, no punctuation next to the text around them (e.g., for * or
+# _ to be emphasis) and nothing that could start a list
+INERT_VALUE = re.compile(r"^(?!\d+[.)](\s|$))[A-Za-z0-9]([A-Za-z0-9 .,:;/?=%+@-]*[A-Za-z0-9])?$")
+CODE_BLOCK = re.compile(r"<pre.*?</pre>", re.DOTALL)
+TAG_START = re.compile(r"(<[^\s<>]*|&#?)$")
+# the start of a line, possibly inside a blockquote or list item
+LINE_START = re.compile(r"^(\s*([>*+-]|\d+[.)]))*\s*$")
+
+# each thread's Markdown converter (see get_markdown)
+_markdown = threading.local()
+
+def get_markdown():
+    """Setting up a Markdown converter (its extensions, pygments for
+    codehilite, ...) costs much more than converting most of the text easel
+    gives it, so each thread keeps one and resets it between uses."""
+    md = getattr(_markdown, 'md', None)
+    if md is None:
+        md = markdown.Markdown(extensions=MD_EXTENSIONS,
+                extension_configs=MD_CONFIG)
+        _markdown.md = md
+    return md.reset()
+
+@functools.lru_cache(maxsize=MD_CACHE_SIZE)
+def render_markdown(mdtext):
+    """convert markdown to html, the same text (e.g., a question's answers
+    or a page pushed to several courses) is only converted once per run"""
+    return get_markdown().convert(mdtext)
+
+def files_link(match):
+    return match.group(0).replace('/', '_').replace('.', '_')
 
+def md2html(mdtext, args={}):
     # If markdown has a link to a file in 'files/', replace the slashes and extension dot with underscores
     if '{files/' in mdtext:
-        for match in re.finditer(r'\{files/[^}]+\}', mdtext):
-            filename = match.group(0)
-            filename = filename.replace('/', '_').replace('.', '_')
-            mdtext = mdtext[:match.start()] + f"{filename}" + mdtext[match.end():]
+        mdtext = FILES_LINK.sub(files_link, mdtext)
 
-    mdtext = mdtext.format(**args)
-    return markdown.markdown(mdtext, extensions=extensions,
-            extension_configs=config)
+    html = render_template(mdtext, args)
+    if html is None:
+        html = render_markdown(mdtext.format(**args))
+    return html
+
+def render_template(mdtext, args):
+    """Convert markdown with template fields to html by converting it with a
+    placeholder for each field and filling in the fields afterward. The
+    conversion is then the same for every course (see render_markdown) and
+    only filling in the fields depends on the course.
+
+    Returns None when the fields can't be filled in afterward, i.e., when a
+    value could change how the markdown around it is converted or a field is
+    in a code block (which pygments highlights)."""
+    if PLACEHOLDER_PREFIX in mdtext:
+        return None
+    formatter = string.Formatter()
+    template = []
+    values = []
+    line = "" # the template so far since the last newline
+    try:
+        parsed = list(formatter.parse(mdtext))
+    except ValueError:
+        # let format() report the mistake
+        return None
+    for i, (literal, field_name, format_spec, conversion) in enumerate(parsed):
+        template.append(literal)
+        line = literal.rsplit('\n', 1)[-1] if '\n' in literal else line + literal
+        if field_name is None:
+            continue
+        if not field_name or field_name[0].isdigit() or '{' in format_spec:
+            return None
+        value, _ = formatter.get_field(field_name, (), args)
+        value = formatter.format_field(formatter.convert_field(value,
+            conversion), format_spec)
+        if not INERT_VALUE.match(value):
+            return None
+        after = parsed[i+1][0] if i+1 < len(parsed) else ""
+        if TAG_START.search(line):
+            # part of a tag, an autolink or an entity depending on the value
+            return None
+        if (value.isdigit() and LINE_START.match(line) and
+                (after[:1] in ('', '.', ')') or after[:1].isdigit())):
+            # the value and the text after it could start a list
+            return None
+        placeholder = PLACEHOLDER.format(len(values))
+        template.append(placeholder)
+        line += placeholder
+        values.append(value)
+
+    if not values:
+        return render_markdown(mdtext.format(**args))
+    template = "".join(template)
+    if ']:' in template:
+        # a value could be the name of a reference link
+        return None
+    # tabs are expanded by column, which depends on the length of the values
+    # before them
+    if any('\t' in line and PLACEHOLDER_PREFIX in line
+            for line in template.split('\n')):
+        return None
+    html = render_markdown(template)
+    if (any(PLACEHOLDER_PREFIX in pre for pre in CODE_BLOCK.findall(html)) or
+            len(PLACEHOLDER_RE.findall(html)) != len(values)):
+        return None
+    return PLACEHOLDER_RE.sub(lambda m: values[int(m.group(1))], html)
 
 def write_config(hostname, token, dry_run):
     home = Path.home()
@@ -127,10 +230,25 @@ def write_config(hostname, token, dry_run):
     else:
         with open(config_file, 'w') as f:
             f.write(json.dumps(config, indent=4))
+        # make sure the next request picks up the new hostname and token
+        api.reset_client()
     return True
 
+def db_format():
+    """the format .easeldb is stored in: sqlite, msgpack or json"""
+    if sqlite_db.is_sqlite(DB_FILE):
+        return "sqlite"
+    if storage.is_msgpack(DB_FILE):
+        return "msgpack"
+    return "json"
+
 def load_db():
-    return tinydb.TinyDB(".easeldb", sort_keys=True, indent=4, separators=(',', ': '))
+    db_format_ = db_format()
+    if db_format_ == "sqlite":
+        return sqlite_db.SQLiteDB(DB_FILE)
+    return storage.EaselDB(DB_FILE,
+            storage=storage.WriteBehind(storage.FORMATS[db_format_]),
+            **JSON_FORMAT)
 
 def setup_directories(dry_run):
     for d in DIRS:
@@ -153,85 +271,15 @@ def post(path, upload, params={}, dry_run=False):
 def put(path, upload, params={}, dry_run=False):
     return do_request(path, params, "PUT", upload, dry_run=dry_run)
 
-def do_request(path, params, method, upload=None, dry_run=False):
-    if not path.startswith("/"):
-        raise ValueError('request path must start with /')
-    if method not in ('GET', 'POST', 'PUT', 'DELETE'):
-        raise ValueError('do_request only recognizes GET, POST, PUT, and DELETE methods')
-
-    conf = Config()
-    headers={'Authorization': 'Bearer '+conf.token}
-    req_url = "https://"+conf.hostname+path
-    data = None
-    if upload is not None and method in ('POST', 'PUT'):
-        data = dict(upload)
-
-    logging.info(f"{method} {req_url}")
-    logging.debug(f"Params: {params}")
-    logging.debug(f"Headers: {headers}")
-    logging.debug("Data: {}".format(json.dumps(data, sort_keys=True, indent=4)))
+def iter_get(path, params={}, dry_run=False):
+    """yield the items of a (possibly paginated) list as the pages arrive"""
+    return api.get_client().iter_get(path, params, dry_run=dry_run)
 
-    if dry_run:
-        print("DRYRUN - making request (use --api or --api-dump for more details)")
-        return {}
-
-
-    # make the request in a loop in case the response is paginated
-    # https://canvas.instructure.com/doc/api/file.pagination.html
-    results = []
-    progress_bar = None
-    while True:
-        # apparently requests can't handle nested dictionaries in the data
-        # parameter so I'm using the json param for it instead
-        resp = requests.request(method, req_url, params=params, json=data,
-                headers=headers)
-
-        if resp.status_code == 500:
-            logging.error("Canvas did not like that request. Perhaps the component"
-                    " you are trying to push was incorrectly formatted. A common "
-                    "mistake is having a typo in the yaml. It might help to "
-                    "inspect the request parameters with the --api-dump flag.")
-        if resp.status_code not in [200, 201, 204, 400, 404, 500]:
-            raise requests.HTTPError("Received unexpected status: {}".format(resp.status_code))
-
-        # check for pagination
-        if 'next' in resp.links:
-            if not results:
-                last_page = int(urllib.parse.parse_qs(urllib.parse.urlparse(resp.links['last']['url']).query)['page'][0])
-                progress_bar = tqdm(total=last_page)
-                progress_bar.update()
-            req_url = resp.links['next']['url']
-            r = resp.json()
-            logging.debug(json.dumps(r, sort_keys=True, indent=4))
-            results += r
-            progress_bar.update()
-        else:
-            if 'application/json' in resp.headers.get('content-type', ''):
-                if len(results) == 0:
-                    # not paginated
-                    results = resp.json()
-                    logging.debug(json.dumps(results, sort_keys=True, indent=4))
-                    if 'errors' in results:
-                        for err in results['errors']:
-                            if isinstance(err, dict):
-                                logging.error("Canvas Error: " + err.get('message'))
-                            else:
-                                logging.error("Canvas Error: " + str(err))
-                else:
-                    # the last page
-                    r = resp.json()
-                    logging.debug(json.dumps(r, sort_keys=True, indent=4))
-                    results += r
-                    progress_bar.update()
-            break
-
-    if progress_bar:
-        progress_bar.close()
-
-    return results
+def do_request(path, params, method, upload=None, dry_run=False):
+    return api.get_client().request(path, params, method, upload, dry_run)
 
 def download_file(url, filename):
-    resp = requests.get(url, stream=True)
+    resp = api.get_client().external("GET", url, stream=True)
     resp.raise_for_status()
     f = open(filename, 'wb')
     for chunk in resp.iter_content(chunk_size=None):
@@ -261,6 +309,10 @@ class Config:
         self.hostname = c["hostname"]
         self.token = c["token"]
         self.db_path = c.get("db_path")
+        # optional request settings (see api.py for the defaults)
+        self.connect_timeout = c.get("connect_timeout")
+        self.read_timeout = c.get("read_timeout")
+        self.retries = c.get("retries")
 
     def __repr__(self):
         return f"Config(hostname={self.hostname},  token={self.token})"
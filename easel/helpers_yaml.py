@@ -1,5 +1,13 @@
 import collections
+import copy
+import glob
+import hashlib
+import logging
+import os
 import os.path
+import pickle
+import threading
+
 import yaml
 
 from easel import assignment
@@ -12,39 +20,130 @@ from easel import page
 from easel import quiz
 from easel import quiz_question
 
+# libyaml parses much faster than pyyaml's pure python version, use it whenever
+# pyyaml was built with it. files are still written with the pure python
+# version since libyaml's emitter wraps some long quoted strings differently,
+# and easel only writes the files it pulls.
+if yaml.__with_libyaml__:
+    BaseLoader = yaml.CFullLoader
+else:
+    BaseLoader = yaml.FullLoader
+
+class Loader(BaseLoader):
+    """reads easel's yaml files (with the component tags defined below)"""
+
+class Dumper(yaml.Dumper):
+    """writes easel's yaml files (see str_representer)"""
+
 # Define custom yaml tags
-yaml.add_constructor("!Assignment", assignment.constructor)
-yaml.add_constructor("!AssignmentGroup", assignment_group.constructor)
-yaml.add_constructor("!ExternalTool", external_tool.constructor)
-yaml.add_constructor("!GradingScheme", grading_scheme.constructor)
-yaml.add_constructor("!Module", module.constructor)
-yaml.add_constructor("!NavigationTabs", navigation_tab.constructor)
-yaml.add_constructor("!Page", page.constructor)
-yaml.add_constructor("!Quiz", quiz.constructor)
-yaml.add_constructor("!QuizQuestion", quiz_question.constructor)
+Loader.add_constructor("!Assignment", assignment.constructor)
+Loader.add_constructor("!AssignmentGroup", assignment_group.constructor)
+Loader.add_constructor("!ExternalTool", external_tool.constructor)
+Loader.add_constructor("!GradingScheme", grading_scheme.constructor)
+Loader.add_constructor("!Module", module.constructor)
+Loader.add_constructor("!NavigationTabs", navigation_tab.constructor)
+Loader.add_constructor("!Page", page.constructor)
+Loader.add_constructor("!Quiz", quiz.constructor)
+Loader.add_constructor("!QuizQuestion", quiz_question.constructor)
+
+# the parsed contents of each file read so far: path -> (mtime, size, contents)
+_parsed = {}
+_parsed_lock = threading.Lock()
+# where parsed files are also saved between runs, None to not save them (see
+# set_disk_cache)
+_disk_cache = None
+_disk_cache_key = None
 
 def read(filepath):
+    """Parse a yaml file.
+
+    A file is usually read several times in one run (e.g., a module's file for
+    each of its items) so the result is kept and reused until the file's
+    modification time or size changes. The callers modify the components they
+    get back so each one gets its own copy."""
     if os.path.isdir(filepath):
         return None
+    st = os.stat(filepath)
+    key = (st.st_mtime_ns, st.st_size)
+    with _parsed_lock:
+        cached = _parsed.get(filepath)
+    if cached is None or cached[0] != key:
+        contents = read_disk_cache(filepath, key)
+        if contents is None:
+            contents = parse(filepath)
+            write_disk_cache(filepath, key, contents)
+        cached = (key, contents)
+        with _parsed_lock:
+            _parsed[filepath] = cached
+    return copy.deepcopy(cached[1])
+
+def parse(filepath):
     with open(filepath) as f:
         try:
-            return yaml.load(f, Loader=yaml.FullLoader)
+            return yaml.load(f, Loader=Loader)
         except Exception as e:
             print("Error parsing yaml in", filepath)
             raise e
 
+def set_disk_cache(directory):
+    """Also save parsed files as pickles in directory so that the next run
+    doesn't have to parse the files that haven't changed. The pickles are
+    only used by the same version of easel since they hold easel's own
+    component objects."""
+    global _disk_cache, _disk_cache_key
+    _disk_cache = directory
+    if directory is not None:
+        sources = glob.glob(os.path.join(os.path.dirname(__file__), "*.py"))
+        _disk_cache_key = max(os.stat(source).st_mtime_ns for source in sources)
+
+def disk_cache_path(filepath):
+    digest = hashlib.sha1(os.path.abspath(filepath).encode()).hexdigest()
+    return os.path.join(_disk_cache, digest + ".pickle")
+
+def read_disk_cache(filepath, key):
+    """the saved contents of the file, None if there aren't any or the file
+    changed since they were saved"""
+    if _disk_cache is None:
+        return None
+    try:
+        with open(disk_cache_path(filepath), 'rb') as f:
+            saved_key, contents = pickle.load(f)
+    except Exception:
+        # missing or unreadable, just parse the file again
+        return None
+    if saved_key != (_disk_cache_key,) + key:
+        return None
+    return contents
+
+def write_disk_cache(filepath, key, contents):
+    if _disk_cache is None or contents is None:
+        return
+    path = disk_cache_path(filepath)
+    try:
+        os.makedirs(_disk_cache, exist_ok=True)
+        # other threads (or easel processes) may be reading the same entry
+        tmp_path = f"{path}.{os.getpid()}.{threading.get_ident()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            pickle.dump(((_disk_cache_key,) + key, contents), f,
+                    pickle.HIGHEST_PROTOCOL)
+        os.replace(tmp_path, path)
+    except Exception as e:
+        logging.info(f"Could not cache the parsed {filepath}: {e}")
+
 def write(filepath, obj):
     if os.path.isdir(filepath):
         return None
-    # write cleaner yaml using the representer functions defined below
-    yaml.add_representer(str, str_representer)
-    yaml.representer.SafeRepresenter.add_representer(str, str_representer) # safe_dump
-
     with open(filepath, 'w') as f:
         tag = f"!{obj.__class__.__name__}"
         data = obj.yaml()
         out = f"{tag}\n{data}"
         f.write(out)
+    with _parsed_lock:
+        _parsed.pop(filepath, None)
+
+def dump(data, **kwargs):
+    """dump data the way easel writes its yaml files"""
+    return yaml.dump(data, Dumper=Dumper, **kwargs)
 
 def str_representer(dumper, data):
     '''Writes block strings for multiple lines, regular strings for single lines'''
@@ -52,6 +151,9 @@ def str_representer(dumper, data):
         return dumper.represent_scalar('tag:yaml.org,2002:str', data, style='|')
     return dumper.represent_scalar('tag:yaml.org,2002:str', data)
 
+# write cleaner yaml
+Dumper.add_representer(str, str_representer)
+
 def construct_node(loader, node, class_):
     if isSequenceNode(node):
         seq = []
@@ -0,0 +1,73 @@
+import json
+import logging
+import os
+import threading
+
+JOURNAL_FILE=".easeljournal"
+
+class Journal:
+    """A record of what a push has finished so far.
+
+    Each time a component has been pushed to a course without canvas rejecting
+    any of its requests, a line with the course, the component's filename and
+    a hash of its contents is added to the journal file. The file is deleted
+    once the push completes. If the push fails part way through, `easel push
+    --resume` reads the journal back and skips what was already pushed (as
+    long as the file hasn't changed since)."""
+
+    def __init__(self, path=JOURNAL_FILE):
+        self.path = path
+        self.finished = set()
+        self.lock = threading.Lock()
+
+    def __repr__(self):
+        return f"Journal(path={self.path}, finished={len(self.finished)})"
+
+    def start(self, resume=False):
+        """begin a push, continuing from the last one if resume"""
+        if not resume:
+            self.finish()
+            return
+        try:
+            with open(self.path) as f:
+                lines = f.readlines()
+        except FileNotFoundError:
+            logging.info(f"No {self.path} to resume from")
+            return
+        for line in lines:
+            try:
+                entry = json.loads(line)
+            except ValueError:
+                # the last line may have been cut off
+                continue
+            self.finished.add((entry['course_id'], entry['filename'],
+                entry['hash']))
+        # rewrite the journal without the cut off line, otherwise the next
+        # entry would be appended to it and lost as well
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'w') as f:
+            for course_id, filename, content_hash in self.finished:
+                f.write(self.entry(course_id, filename, content_hash) + '\n')
+        os.replace(tmp_path, self.path)
+
+    def done(self, course_id, filename, content_hash):
+        return (course_id, filename, content_hash) in self.finished
+
+    def entry(self, course_id, filename, content_hash):
+        return json.dumps({'course_id': course_id, 'filename': filename,
+            'hash': content_hash})
+
+    def record(self, course_id, filename, content_hash):
+        entry = self.entry(course_id, filename, content_hash)
+        with self.lock:
+            self.finished.add((course_id, filename, content_hash))
+            with open(self.path, 'a') as f:
+                f.write(entry + '\n')
+
+    def finish(self):
+        """forget the journal once the push is complete"""
+        self.finished = set()
+        try:
+            os.remove(self.path)
+        except FileNotFoundError:
+            pass
@@ -50,6 +50,11 @@ class Module(component.Component):
         component.filter_fields(fields, desired_fields, defaults)
         return Module(**fields)
 
+    def postprocess_unchanged(self, db, course_, dry_run):
+        # the items each check whether they changed, and the components they
+        # refer to may have
+        self.postprocess(db, course_, dry_run)
+
     def postprocess(self, db, course_, dry_run):
         course_id = course_.canvas_id
         cid = canvas_id.CanvasID(self.filename, course_id)
@@ -114,9 +119,8 @@ def build_item(item, indent=0):
         return item
     return {'item': item, 'indent': indent}
 
-def pull_all(db, course_, dry_run):
-    modules = []
-    m = helpers.get(MODULES_PATH.format(course_.canvas_id),
+def pull_all(db, course_, dry_run, jobs=1):
+    m = helpers.iter_get(MODULES_PATH.format(course_.canvas_id),
             params={'include': ['items']}, dry_run=dry_run)
     for module_ in m:
         if 'items' not in module_ or not module_['items']:
@@ -199,5 +203,4 @@ def pull_all(db, course_, dry_run):
             all_items += items[position]
         # add positionless items to the end
         module_['items'] = all_items + items.get(0, [])
-        modules.append(Module.build(module_))
-    return modules
+        yield Module.build(module_)
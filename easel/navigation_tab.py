@@ -1,5 +1,4 @@
 import logging
-import yaml
 
 from easel import component
 from easel import course
@@ -79,7 +78,7 @@ class NavigationTabs:
         for tab in self.tabs:
             if not tab.hidden:
                 labels.append(tab.label)
-        return yaml.dump(labels)
+        return helpers_yaml.dump(labels)
 
 # Needed for custom yaml tag
 def constructor(loader, node):
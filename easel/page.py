@@ -5,6 +5,7 @@ from easel import component
 from easel import course
 from easel import helpers
 from easel import helpers_yaml
+from easel import parallel
 
 PAGES_PATH=course.COURSE_PATH+"/pages"
 PAGE_PATH=PAGES_PATH+"/{}" # page url
@@ -77,12 +78,12 @@ def pull_page(db, course_id, page_url, dry_run):
         cid.save(db)
     return Page.build(page_), cid
 
-def pull_all(db, course_, dry_run):
-    r = helpers.get(PAGES_PATH.format(course_.canvas_id),
+def pull_all(db, course_, dry_run, jobs=1):
+    r = helpers.iter_get(PAGES_PATH.format(course_.canvas_id),
             dry_run=dry_run)
-    pages = []
     print("pulling page contents")
-    for p in tqdm(r):
-        page_, _ = pull_page(db, course_.canvas_id, p.get('url'), dry_run)
-        pages.append(page_)
-    return pages
+    # pull each page while the rest of the list is still arriving
+    pulled = parallel.imap(lambda p: pull_page(db, course_.canvas_id,
+        p.get('url'), dry_run)[0], r, jobs)
+    for page_ in tqdm(pulled):
+        yield page_
@@ -0,0 +1,96 @@
+import collections
+import concurrent.futures
+import sys
+import threading
+
+class OutputRouter:
+    """Stands in for sys.stdout while tasks run on worker threads. Anything a
+    task prints is held in a buffer for that thread and written out in one
+    piece once the task finishes, so the progress messages from different
+    components don't get interleaved line by line."""
+
+    def __init__(self, stream):
+        self.stream = stream
+        self.local = threading.local()
+        self.lock = threading.Lock()
+
+    def write(self, text):
+        buffer = getattr(self.local, "buffer", None)
+        if buffer is None:
+            with self.lock:
+                return self.stream.write(text)
+        buffer.append(text)
+        return len(text)
+
+    def flush(self):
+        if getattr(self.local, "buffer", None) is None:
+            self.stream.flush()
+
+    def __getattr__(self, name):
+        return getattr(self.stream, name)
+
+    def capture(self, task):
+        self.local.buffer = []
+        try:
+            return task()
+        finally:
+            output = "".join(self.local.buffer)
+            self.local.buffer = None
+            if output:
+                with self.lock:
+                    self.stream.write(output)
+                    self.stream.flush()
+
+def run(tasks, jobs=1):
+    """Run each of the given callables, at most jobs of them at a time.
+
+    The tasks must not depend on each other. With a single job they are run in
+    order on the current thread. Otherwise the first exception raised by a task
+    cancels the tasks that haven't started yet and is re-raised once the
+    running ones finish."""
+    if jobs <= 1 or len(tasks) <= 1:
+        for task in tasks:
+            task()
+        return
+
+    router = OutputRouter(sys.stdout)
+    sys.stdout = router
+    try:
+        with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+            futures = [pool.submit(router.capture, task) for task in tasks]
+            error = None
+            for future in concurrent.futures.as_completed(futures):
+                if future.cancelled():
+                    continue
+                e = future.exception()
+                if e and not error:
+                    error = e
+                    for f in futures:
+                        f.cancel()
+        if error:
+            raise error
+    finally:
+        sys.stdout = router.stream
+
+def imap(func, items, jobs=1):
+    """Like map(func, items), but with up to jobs calls running at once.
+
+    Results are yielded in the order of the items as soon as they are ready.
+    Items are only taken from the iterable as workers free up, so it may be a
+    stream (e.g., helpers.iter_get) that is still being fetched."""
+    if jobs <= 1:
+        yield from map(func, items)
+        return
+
+    with concurrent.futures.ThreadPoolExecutor(max_workers=jobs) as pool:
+        pending = collections.deque()
+        try:
+            for item in items:
+                pending.append(pool.submit(func, item))
+                if len(pending) >= jobs*2:
+                    yield pending.popleft().result()
+            while pending:
+                yield pending.popleft().result()
+        finally:
+            for future in pending:
+                future.cancel()
@@ -0,0 +1,181 @@
+import hashlib
+import logging
+import os
+import os.path
+import re
+
+from easel import helpers
+from easel import helpers_yaml
+
+# files that are pushed as part of the course rather than as a component (see
+# commands.push_file)
+COURSE_FILES = ["syllabus.md", "grading_scheme.yaml", "navigation.yaml",
+        "course.yaml"]
+# a template field in markdown, e.g., {course_id}, {some-assignment} or
+# {files/syllabus.pdf} (but not an escaped {{brace}})
+TEMPLATE_FIELD = re.compile(r"(?<!\{)\{([^{}]+)\}(?!\})")
+
+class Node:
+    """Something to push to each course: a component read from its yaml file,
+    a file to upload or one of the COURSE_FILES"""
+
+    def __init__(self, filename, component=None, upload=False):
+        self.filename = filename
+        self.component = component
+        self.upload = upload
+        self.deps = set()
+        self._content_hash = None
+
+    def __repr__(self):
+        return f"Node(filename={self.filename}, deps={sorted(self.deps)})"
+
+    def template_key(self):
+        """the name other components use for this one's canvas id in their
+        markdown (see helpers.get_course_template_fields)"""
+        if self.filename.startswith('files/'):
+            return self.filename.replace('/', '_').replace('.', '_')
+        return self.filename.split('/')[-1].split('.')[0]
+
+    def content_hash(self):
+        """a hash of the node's file, to tell whether it changed since it was
+        last pushed (see journal.Journal)"""
+        if self._content_hash is None:
+            with open(self.filename, 'rb') as f:
+                self._content_hash = hashlib.sha1(f.read()).hexdigest()
+        return self._content_hash
+
+    def text(self):
+        """the markdown of this node which may contain template fields"""
+        if self.filename == "syllabus.md":
+            with open(self.filename) as f:
+                return f.read()
+        texts = []
+        for field in ["body", "description"]:
+            value = getattr(self.component, field, None)
+            if isinstance(value, str):
+                texts.append(value)
+        return '\n'.join(texts)
+
+class Plan:
+    """Decides the order in which to push components.
+
+    Every yaml file is read once when it is added to the plan. The plan then
+    links each component to the others it needs to exist in Canvas first:
+    - the assignment group named by an assignment or quiz
+    - the items of a module
+    - anything referenced by a template field in the markdown (e.g.,
+      {files/notes.pdf} or {some-assignment})
+    waves() orders the components so that each one comes after everything it
+    depends on. The components within a wave don't depend on each other and
+    may be pushed at the same time."""
+
+    def __init__(self):
+        self.nodes = {}
+        self.banks = set()
+
+    def add(self, filepath):
+        """add a component argument given on the command line"""
+        if os.path.isdir(filepath) and not filepath.startswith("files"):
+            if filepath not in helpers.DIRS:
+                logging.error("Invalid directory: "+filepath)
+                return
+            for child_path in os.listdir(filepath):
+                self.add_component(filepath + '/' + child_path, False)
+        elif filepath.startswith("files"):
+            if os.path.isdir(filepath):
+                for dir_path, _, filenames in os.walk(filepath):
+                    for filename in filenames:
+                        self.add_upload(dir_path + '/' + filename)
+            elif os.path.isfile(filepath):
+                self.add_upload(filepath)
+            else:
+                logging.error("Invalid File type for " + filepath)
+        elif not os.path.isfile(filepath):
+            logging.error("Cannot find file: " + filepath)
+        elif filepath in COURSE_FILES:
+            if filepath not in self.nodes:
+                self.nodes[filepath] = Node(filepath)
+        else:
+            self.add_component(filepath, True)
+
+    def add_component(self, filepath, upload_others):
+        if filepath in self.nodes:
+            return
+        component = helpers_yaml.read(filepath)
+        if component is None or not hasattr(component, "push"):
+            if upload_others and not isinstance(component, (list, dict)):
+                # not a yaml file so assume it's a file to upload
+                self.add_upload(filepath)
+            return
+        component.filename = filepath
+        self.nodes[filepath] = Node(filepath, component)
+
+    def add_upload(self, filepath):
+        if filepath not in self.nodes:
+            self.nodes[filepath] = Node(filepath, upload=True)
+
+    def link(self):
+        """find the dependencies between the nodes"""
+        groups = {}
+        keys = {}
+        for node in self.nodes.values():
+            if type(node.component).__name__ == "AssignmentGroup":
+                groups[node.component.name] = node.filename
+            keys.setdefault(node.template_key(), []).append(node.filename)
+
+        for node in self.nodes.values():
+            node.deps = set()
+            group = getattr(node.component, "assignment_group", None)
+            if group in groups:
+                node.deps.add(groups[group])
+
+            if type(node.component).__name__ == "Module":
+                for item in node.component.items or []:
+                    if isinstance(item, dict):
+                        item = item.get('item')
+                    if item in self.nodes:
+                        node.deps.add(item)
+
+            if type(node.component).__name__ == "Quiz":
+                for qq in node.component.quiz_questions or []:
+                    if isinstance(qq, dict):
+                        qq = qq.get('bank')
+                    if isinstance(qq, str):
+                        self.banks.add(qq)
+
+            if node.upload:
+                continue
+            for field in TEMPLATE_FIELD.findall(node.text()):
+                if field.startswith('files/'):
+                    field = field.replace('/', '_').replace('.', '_')
+                for dep in keys.get(field, []):
+                    if dep != node.filename:
+                        node.deps.add(dep)
+
+    def waves(self):
+        """group the nodes into waves, where each node comes in a later wave
+        than all of its dependencies"""
+        from easel import quiz # import here to prevent circular import
+        self.link()
+        # read each question bank once up front rather than once per quiz and
+        # course (and fail before pushing anything if one is missing)
+        for bank in sorted(self.banks):
+            quiz.get_bank(bank)
+
+        waves = []
+        done = set()
+        remaining = list(self.nodes.values())
+        while remaining:
+            wave = [node for node in remaining if node.deps <= done]
+            if not wave:
+                # the remaining components refer to each other (e.g., two
+                # pages linking to each other). push them in the given order
+                # and hope canvas already knows about the ones we need.
+                node = remaining[0]
+                logging.info(f"circular dependency between {node.filename} "
+                        f"and {sorted(node.deps - done)}")
+                wave = [node]
+            waves.append(wave)
+            done.update(node.filename for node in wave)
+            remaining = [node for node in remaining if node.filename not in done]
+        return waves
@@ -1,6 +1,9 @@
+import copy
+import hashlib
+import json
 import logging
 import random
-import tinydb
+import threading
 from tqdm import tqdm
 
 from easel import assignment_group
@@ -9,6 +12,7 @@ from easel import component
 from easel import course
 from easel import helpers
 from easel import helpers_yaml
+from easel import parallel
 
 QUIZZES_PATH=course.COURSE_PATH+"/quizzes"
 QUIZ_PATH=QUIZZES_PATH+"/{}"
@@ -164,13 +168,10 @@ class Quiz(component.Component):
 
     def get_assignment_group_id(self, db, course_id):
         if self.assignment_group:
-            ags = db.table(assignment_group.ASSIGN_GROUPS_TABLE)
-            results = ags.search(tinydb.Query().name == self.assignment_group)
-            if not results:
+            group = assignment_group.find_by_name(db, self.assignment_group)
+            if group is None:
                 raise ValueError(f"failed to find AssignmentGroup called '{self.assignment_group}'")
-            # assumes assignment group names will be unique
-            fname = assignment_group.AssignmentGroup(**dict(results[0])).filename
-            cid = canvas_id.CanvasID(fname, course_id)
+            cid = canvas_id.CanvasID(group.filename, course_id)
             cid.find_id(db)
             self.assignment_group_id = cid.canvas_id
 
@@ -197,6 +198,23 @@ class Quiz(component.Component):
         self.remember_published = self.published
         self.published = False
 
+    def hash_fields(self):
+        # remember_published and quiz_questions are easel's own fields.
+        # published is what the quiz ends up as (see postprocess) and the
+        # questions include the contents of the banks they come from since
+        # they're pushed along with the quiz.
+        fields = {k: v for k, v in self.gen_fields()
+                if k not in ('remember_published', 'quiz_questions')}
+        fields['published'] = self.remember_published
+        questions = []
+        for qq in self.quiz_questions or []:
+            bank = qq.get('bank') if isinstance(qq, dict) else qq
+            if isinstance(bank, str):
+                questions.append([qq, get_bank(bank).content_hash()])
+            else:
+                questions.append(qq)
+        return {WRAPPER: fields, 'quiz_questions': questions}
+
     def postprocess(self, db, course_, dry_run):
         course_id = course_.canvas_id
         cid = canvas_id.CanvasID(self.filename, course_id)
@@ -212,11 +230,11 @@ class Quiz(component.Component):
         # canvas to match it
         quiz_path = QUIZ_PATH.format(course_id, cid.canvas_id)
         questions_path = quiz_path + "/questions"
-        quiz_questions = helpers.get(questions_path, dry_run)
+        quiz_questions = helpers.get(questions_path, dry_run=dry_run)
         for question in quiz_questions:
             if 'id' in question:
                 path = questions_path+"/{}".format(question['id'])
-                helpers.delete(path)
+                helpers.delete(path, dry_run=dry_run)
 
         # prepare actual QuizQuestion objects to be pushed to canvas
         questions = build_questions(self.quiz_questions)
@@ -233,7 +251,8 @@ class Quiz(component.Component):
         # you create the questions. so I'm hackily unpublishing and then
         # publishing (if the user wants to publish it)
         if self.remember_published:
-            helpers.put(quiz_path, {"quiz": {"published": True}})
+            helpers.put(quiz_path, {"quiz": {"published": True}},
+                    dry_run=dry_run)
 
     def pull(self, db, course_, dry_run):
         cid = canvas_id.CanvasID(self.filename, course_.canvas_id)
@@ -246,34 +265,34 @@ class Quiz(component.Component):
 QUESTION_ID_KEY='id'
 def build_questions(quiz_questions):
     questions = []
+    # the questions of each bank that haven't been used on this quiz yet
+    pickers = {}
+    def picker(filename):
+        if filename not in pickers:
+            pickers[filename] = Picker(get_bank(filename))
+        return pickers[filename]
+
     for qq in quiz_questions:
         if isinstance(qq, str):
             # just a string, assume it's a yaml file's path
             # open the yaml file and read it in directly
             # assume it contains 1 or more QuizQuestion definitions
-            questions += load_questions_file(qq)
+            bank = picker(qq)
+            for i in range(len(bank.bank.questions)):
+                bank.use(i)
+                questions.append(bank.bank.question(i))
         elif isinstance(qq, dict):
             if 'bank' in qq:
                 # assume they are referring to a quiz_questions file
-                bank_questions = load_questions_file(qq['bank'])
+                bank = picker(qq['bank'])
                 if QUESTION_ID_KEY in qq:
-                    # grab question at that position in the file
-                    # TODO: make sure we haven't already picked that
-                    # question. for now maybe just encourage users to order
-                    # the questions so that the randomized ones are last
+                    # grab the question with that id in the file
                     qid = qq[QUESTION_ID_KEY]
-                    found = None
-                    for q in bank_questions:
-                        if q.id and q.id == qid:
-                            if found:
-                                logging.warn("Already found a question with "
-                                        f"the id {qid}. The ids in a file "
-                                        "should be unique. For now we'll use "
-                                        "the question with this id found last "
-                                        "in the list.")
-                            q.id = None
-                            found = q
-                    if found:
+                    i = bank.bank.by_id.get(qid)
+                    if i is not None:
+                        bank.use(i)
+                        found = bank.bank.question(i)
+                        found.id = None
                         questions.append(found)
                     else:
                         logging.error("Failed to find a question with the id "
@@ -282,29 +301,100 @@ def build_questions(quiz_questions):
                     # they didn't specify a particular question so pick one
                     # at random from the file but make sure we haven't yet
                     # used that one
-                    indexes = list(range(len(bank_questions)))
-                    random.shuffle(indexes)
-                    for i in indexes:
-                        if bank_questions[i] not in questions:
-                            questions.append(bank_questions[i])
-                            break
-                        # TODO: what if we've already used all of them?
+                    questions.append(bank.bank.question(bank.pick()))
             else:
                 # assume they are directly specifying a question here
                 from easel import quiz_question # import here to prevent circular import
                 questions.append(quiz_question.QuizQuestion(**qq))
         else:
-            raise TypeError(f"Invalid quiz question specification on Quiz {self}")
+            raise TypeError(f"Invalid quiz question specification {qq}")
     return questions
 
+class Bank:
+    """A file of quiz questions that quizzes pick questions from.
+
+    Each bank is read once per run (see get_bank and planner.Plan.waves) and
+    its questions are indexed by their id."""
+
+    def __init__(self, filename):
+        self.filename = filename
+        # I don't want to require users to put a single question in a list so
+        # we detect if it's a list and if not, put it in a list
+        contents = helpers_yaml.read(filename)
+        if not isinstance(contents, list):
+            contents = [contents]
+        self.questions = contents
+        self._content_hash = None
+        self.by_id = {} # question id -> position in the file
+        for i, question in enumerate(self.questions):
+            qid = getattr(question, 'id', None)
+            if not qid:
+                continue
+            if qid in self.by_id:
+                logging.warn(f"Already found a question with the id {qid} "
+                        f"in {filename}. The ids in a file should be unique. "
+                        "For now we'll use the question with this id found "
+                        "last in the list.")
+            self.by_id[qid] = i
+
+    def __repr__(self):
+        return f"Bank(filename={self.filename}, questions={len(self.questions)})"
+
+    def content_hash(self):
+        """a hash of the questions, so that a quiz is pushed again when its
+        bank changes (see Quiz.hash_fields)"""
+        if self._content_hash is None:
+            data = json.dumps([dict(q) for q in self.questions],
+                    sort_keys=True, default=str)
+            self._content_hash = hashlib.sha1(data.encode('utf-8')).hexdigest()
+        return self._content_hash
+
+    def question(self, i):
+        # questions are modified when they are picked and pushed so every
+        # caller gets its own copy
+        return copy.deepcopy(self.questions[i])
+
+class Picker:
+    """Picks questions from a Bank for a single quiz without picking the same
+    one twice.
+
+    The positions of the unused questions are kept in a list along with where
+    each one is in that list, so using a question (swapping it with the last
+    one and popping it) and picking a random one are both O(1)."""
+
+    def __init__(self, bank):
+        self.bank = bank
+        self.remaining = list(range(len(bank.questions)))
+        self.where = list(range(len(bank.questions)))
+
+    def use(self, i):
+        j = self.where[i]
+        if j is None:
+            return
+        last = self.remaining[-1]
+        self.remaining[j] = last
+        self.where[last] = j
+        self.remaining.pop()
+        self.where[i] = None
+
+    def pick(self):
+        """the position of a random unused question"""
+        if not self.remaining:
+            raise ValueError(f"The question bank {self.bank.filename} ran out "
+                    f"of questions, it only has {len(self.bank.questions)}")
+        i = self.remaining[random.randrange(len(self.remaining))]
+        self.use(i)
+        return i
+
+# question banks are read once per run (see planner.Plan.waves)
+_banks = {}
+_banks_lock = threading.Lock()
 
-def load_questions_file(filename):
-    # I don't want to require users to put a single question in a list so we
-    # detect if it's a list and if not, put it in a list
-    contents = helpers_yaml.read(filename)
-    if not isinstance(contents, list):
-        contents = [contents]
-    return contents
+def get_bank(filename):
+    with _banks_lock:
+        if filename not in _banks:
+            _banks[filename] = Bank(filename)
+        return _banks[filename]
 
 # Needed for custom yaml tag
 def constructor(loader, node):
@@ -359,12 +449,12 @@ def pull(db, course_, quiz_, dry_run):
 
     return Quiz.build(quiz_), cid
 
-def pull_all(db, course_, dry_run):
-    r = helpers.get(QUIZZES_PATH.format(course_.canvas_id), dry_run=dry_run)
-    quizzes = []
+def pull_all(db, course_, dry_run, jobs=1):
+    r = helpers.iter_get(QUIZZES_PATH.format(course_.canvas_id), dry_run=dry_run)
     print("pulling quiz questions")
-    for quiz_json in tqdm(r):
-        quiz_, _ = pull(db, course_, quiz_json, dry_run)
+    # pull each quiz while the rest of the list is still arriving
+    pulled = parallel.imap(lambda quiz_json: pull(db, course_, quiz_json,
+        dry_run)[0], r, jobs)
+    for quiz_ in tqdm(pulled):
         if quiz_:
-            quizzes.append(quiz_)
-    return quizzes
+            yield quiz_
@@ -0,0 +1,334 @@
+import contextlib
+import json
+import os
+import re
+import shutil
+import sqlite3
+
+import tinydb
+
+from easel import storage
+
+# the first bytes of every sqlite database file
+HEADER=b"SQLite format 3\x00"
+BUSY_TIMEOUT=30 # seconds to wait for another process to finish writing
+# only fields with simple names are compiled into sql (the name is written
+# into the sql itself so that sqlite can use the indexes below)
+FIELD=re.compile(r"^\w+$")
+REGEX_SPECIAL=set(".^$*+?{}[]\\|()")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS documents (
+    tbl TEXT NOT NULL,
+    doc_id INTEGER NOT NULL,
+    data TEXT NOT NULL,
+    PRIMARY KEY (tbl, doc_id)
+);
+CREATE INDEX IF NOT EXISTS documents_filename ON documents (tbl,
+    json_extract(data, '$.filename'), json_extract(data, '$.course_id'));
+CREATE INDEX IF NOT EXISTS documents_canvas_id ON documents (tbl,
+    json_extract(data, '$.course_id'), json_extract(data, '$.canvas_id'));
+"""
+
+def is_sqlite(path):
+    """whether the file at path is a sqlite database"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(HEADER)) == HEADER
+    except OSError:
+        return False
+
+def compile_query(query_hash):
+    """Translate a TinyDB query into a sql condition.
+
+    Returns the sql, its arguments and whether the sql is exactly the query,
+    or None if no part of it can be translated. When the sql only narrows the
+    search down (e.g., one side of an and, a regex prefix), the rows it finds
+    still have to be checked against the query itself."""
+    if not isinstance(query_hash, tuple) or not query_hash:
+        return None
+    op = query_hash[0]
+    if op == '==' and len(query_hash) == 3:
+        _, path, value = query_hash
+        if (len(path) != 1 or not FIELD.match(path[0]) or value is None or
+                not isinstance(value, (str, int, float))):
+            return None
+        return f"json_extract(data, '$.{path[0]}') = ?", [value], True
+    if op == 'matches' and len(query_hash) == 3:
+        _, path, regex = query_hash
+        if (len(path) != 1 or not FIELD.match(path[0]) or
+                not regex.startswith('^')):
+            return None
+        prefix = ""
+        for c in regex[1:]:
+            if c in REGEX_SPECIAL:
+                if c in "*?{":
+                    # the last character is optional or repeated
+                    prefix = prefix[:-1]
+                break
+            prefix += c
+        if not prefix:
+            return None
+        return (f"substr(json_extract(data, '$.{path[0]}'), 1, ?) = ?",
+                [len(prefix), prefix], False)
+    if op == 'and':
+        sql = []
+        args = []
+        exact = True
+        for part in query_hash[1]:
+            compiled = compile_query(part)
+            if compiled is None:
+                exact = False
+                continue
+            sql.append(compiled[0])
+            args += compiled[1]
+            exact = exact and compiled[2]
+        if not sql:
+            return None
+        return " AND ".join(sql), args, exact
+    return None
+
+class SQLiteTable:
+    """A table in the sqlite version of the .easeldb database.
+
+    It implements the parts of tinydb.table.Table that easel uses so that the
+    rest of easel doesn't have to know which kind of db it has. Every table
+    is stored in the same sqlite table with the documents as json. Queries on
+    a component's filename and course or on a course's canvas ids are answered
+    with an index (see SCHEMA) rather than by reading every document."""
+
+    def __init__(self, db, name):
+        self.db = db
+        self.name = name
+
+    def __repr__(self):
+        return f"SQLiteTable(name={self.name}, total={len(self)})"
+
+    def rows(self, cond=None, doc_ids=None):
+        sql = "SELECT doc_id, data FROM documents WHERE tbl = ?"
+        args = [self.name]
+        exact = cond is None
+        if cond is not None:
+            compiled = compile_query(getattr(cond, '_hash', None))
+            if compiled is not None:
+                sql += " AND " + compiled[0]
+                args += compiled[1]
+                exact = compiled[2]
+        if doc_ids is not None:
+            doc_ids = list(doc_ids)
+            sql += " AND doc_id IN ({})".format(", ".join("?" * len(doc_ids)))
+            args += doc_ids
+        sql += " ORDER BY doc_id"
+        for doc_id, data in self.db.conn.execute(sql, args).fetchall():
+            document = tinydb.table.Document(json.loads(data), doc_id)
+            if exact or cond(document):
+                yield document
+
+    @storage.locked
+    def all(self):
+        return list(self.rows())
+
+    @storage.locked
+    def search(self, cond):
+        return list(self.rows(cond))
+
+    @storage.locked
+    def get(self, cond=None, doc_id=None, doc_ids=None):
+        if doc_id is not None:
+            doc_ids = [doc_id]
+        documents = list(self.rows(cond, doc_ids))
+        if doc_ids is not None and doc_id is None:
+            return documents
+        return documents[0] if documents else None
+
+    @storage.locked
+    def contains(self, cond=None, doc_id=None):
+        return self.get(cond, doc_id) is not None
+
+    @storage.locked
+    def count(self, cond):
+        return len(self.search(cond))
+
+    @storage.locked
+    def __len__(self):
+        return self.db.conn.execute(
+                "SELECT COUNT(*) FROM documents WHERE tbl = ?",
+                [self.name]).fetchone()[0]
+
+    def __iter__(self):
+        return iter(self.all())
+
+    def _insert(self, document):
+        if isinstance(document, tinydb.table.Document):
+            doc_id = document.doc_id
+        else:
+            doc_id = self.db.conn.execute(
+                    "SELECT COALESCE(MAX(doc_id), 0) + 1 FROM documents "
+                    "WHERE tbl = ?", [self.name]).fetchone()[0]
+        self.db.conn.execute("INSERT INTO documents (tbl, doc_id, data) "
+                "VALUES (?, ?, ?)", [self.name, doc_id, json.dumps(dict(document))])
+        return doc_id
+
+    def _update(self, fields, cond=None, doc_ids=None):
+        updated = []
+        for document in list(self.rows(cond, doc_ids)):
+            if callable(fields):
+                fields(document)
+            else:
+                document.update(fields)
+            self.db.conn.execute("UPDATE documents SET data = ? WHERE tbl = ? "
+                    "AND doc_id = ?", [json.dumps(dict(document)), self.name,
+                        document.doc_id])
+            updated.append(document.doc_id)
+        return updated
+
+    @storage.locked
+    def insert(self, document):
+        with self.db.transaction():
+            return self._insert(document)
+
+    @storage.locked
+    def insert_multiple(self, documents):
+        with self.db.transaction():
+            return [self._insert(document) for document in documents]
+
+    @storage.locked
+    def update(self, fields, cond=None, doc_ids=None):
+        with self.db.transaction():
+            return self._update(fields, cond, doc_ids)
+
+    @storage.locked
+    def upsert(self, document, cond=None):
+        doc_ids = None
+        if isinstance(document, tinydb.table.Document):
+            doc_ids = [document.doc_id]
+        elif cond is None:
+            raise ValueError("If you don't specify a search query, you must "
+                    "specify a doc_id. Hint: use a table.Document object.")
+        with self.db.transaction():
+            updated = self._update(document, cond, doc_ids)
+            if updated:
+                return updated
+            return [self._insert(document)]
+
+    @storage.locked
+    def remove(self, cond=None, doc_ids=None):
+        if cond is None and doc_ids is None:
+            raise RuntimeError('Use truncate() to remove all documents')
+        with self.db.transaction():
+            removed = [document.doc_id for document in self.rows(cond, doc_ids)]
+            self.db.conn.executemany("DELETE FROM documents WHERE tbl = ? AND "
+                    "doc_id = ?", [[self.name, doc_id] for doc_id in removed])
+        return removed
+
+    @storage.locked
+    def truncate(self):
+        with self.db.transaction():
+            self.db.conn.execute("DELETE FROM documents WHERE tbl = ?",
+                    [self.name])
+
+    def clear_cache(self):
+        pass
+
+class SQLiteDB:
+    """The .easeldb database stored in sqlite rather than as a json file (see
+    easel db migrate)"""
+
+    def __init__(self, path):
+        self.path = path
+        # the connection is in autocommit mode and writes are grouped with
+        # transaction() instead. other easel processes may be using the db at
+        # the same time so wait a while for them rather than failing when the
+        # db is busy.
+        self.conn = sqlite3.connect(path, timeout=BUSY_TIMEOUT,
+                isolation_level=None, check_same_thread=False)
+        # write ahead logging lets readers carry on while another process
+        # writes
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        with self.transaction():
+            for statement in SCHEMA.split(';'):
+                if statement.strip():
+                    self.conn.execute(statement)
+        self._tables = {}
+
+    def __repr__(self):
+        return f"SQLiteDB(path={self.path})"
+
+    @contextlib.contextmanager
+    def transaction(self):
+        """Group writes into a single transaction. The db is locked for
+        writing as soon as it begins so that reading the current documents
+        and writing the changes (e.g., in upsert) can't be interleaved with
+        another process doing the same."""
+        with storage.LOCK:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                yield
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+            self.conn.execute("COMMIT")
+
+    @storage.locked
+    def table(self, name, **kwargs):
+        if name not in self._tables:
+            self._tables[name] = SQLiteTable(self, name)
+        return self._tables[name]
+
+    @storage.locked
+    def tables(self):
+        return {row[0] for row in
+                self.conn.execute("SELECT DISTINCT tbl FROM documents")}
+
+    @storage.locked
+    def drop_table(self, name):
+        self.table(name).truncate()
+        self._tables.pop(name, None)
+
+    def flush(self):
+        # every change is written as it's made
+        pass
+
+    @storage.locked
+    def compact(self):
+        """give the space of removed documents back (see easel db compact)"""
+        self.conn.execute("VACUUM")
+
+    @storage.locked
+    def backup(self, path):
+        """copy the db to path. copying the file itself would miss the
+        changes that are still in the write ahead log."""
+        with contextlib.closing(sqlite3.connect(path)) as target:
+            self.conn.backup(target)
+
+    @storage.locked
+    def close(self):
+        self.conn.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        self.close()
+
+def migrate(db, path, backup_path):
+    """Copy every table of db into a new sqlite db at path, keeping the
+    document ids. The new db is written next to path and then moved into place
+    so that an interrupted migration leaves path as it was. The old file is
+    kept in backup_path."""
+    # the old file won't be written to again
+    db.flush()
+    tmp_path = path + ".tmp"
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    new_db = SQLiteDB(tmp_path)
+    try:
+        for name in db.tables():
+            table = db.table(name)
+            new_db.table(name).insert_multiple(
+                    tinydb.table.Document(dict(document), document.doc_id)
+                    for document in table.all())
+    finally:
+        new_db.close()
+    shutil.copy2(path, backup_path)
+    os.replace(tmp_path, path)
@@ -0,0 +1,301 @@
+import copy
+import functools
+import json
+import os
+import shutil
+import threading
+import time
+
+import tinydb
+import tinydb.middlewares
+import tinydb.storages
+try:
+    import fcntl
+except ImportError:
+    # not available on windows, where the db file isn't locked
+    fcntl = None
+try:
+    # optional, for the compact db format (pip install easel-cli[msgpack])
+    import msgpack
+except ImportError:
+    msgpack = None
+
+# TinyDB is not thread safe: every write is a read, modify, write of the whole
+# file and each table keeps its own query cache and next document id. When
+# components are pushed in parallel, every table operation holds this lock so
+# the threads take turns with the db.
+LOCK = threading.RLock()
+FLUSH_INTERVAL=5 # seconds between writes of the db file while a command runs
+# the fields that identify a document in each table when merging changes from
+# another easel process (see merge)
+MERGE_KEYS = {
+        "canvas_ids": ["filename", "course_id"],
+        "courses": ["canvas_id"],
+        }
+DEFAULT_MERGE_KEY = ["filename"]
+# the first bytes of a db stored with MsgpackStorage
+MSGPACK_HEADER=b"easeldb msgpack\n"
+
+def locked(method):
+    @functools.wraps(method)
+    def wrapper(*args, **kwargs):
+        with LOCK:
+            return method(*args, **kwargs)
+    return wrapper
+
+class LockedTable(tinydb.table.Table):
+    """A TinyDB table that may be shared between threads"""
+
+    def __iter__(self):
+        with LOCK:
+            documents = list(super().__iter__())
+        return iter(documents)
+
+for _name in ["insert", "insert_multiple", "all", "search", "get", "contains",
+        "update", "update_multiple", "upsert", "remove", "truncate", "count",
+        "clear_cache", "__len__"]:
+    setattr(LockedTable, _name, locked(getattr(tinydb.table.Table, _name)))
+
+class EaselDB(tinydb.TinyDB):
+    """The .easeldb database"""
+
+    table_class = LockedTable
+
+    @locked
+    def table(self, name, **kwargs):
+        return super().table(name, **kwargs)
+
+    @locked
+    def flush(self):
+        """write out any buffered changes now"""
+        if hasattr(self.storage, "flush"):
+            self.storage.flush()
+
+    def compact(self):
+        """write out the whole db now (see easel db compact)"""
+        self.flush()
+
+class FileLock:
+    """An exclusive advisory lock on a file, held across processes"""
+
+    def __init__(self, path):
+        self.path = path
+        self.file = None
+
+    def __enter__(self):
+        self.file = open(self.path, 'a')
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_EX)
+        return self
+
+    def __exit__(self, *args):
+        if fcntl is not None:
+            fcntl.flock(self.file.fileno(), fcntl.LOCK_UN)
+        self.file.close()
+
+def merge_key(table_name, document):
+    fields = MERGE_KEYS.get(table_name, DEFAULT_MERGE_KEY)
+    key = [document.get(field) for field in fields]
+    if all(value is None for value in key):
+        # no natural key so the document is its own key
+        return json.dumps(document, sort_keys=True, default=str)
+    return json.dumps(key, default=str)
+
+def by_merge_key(table_name, table):
+    """key -> (doc_id, document) for a table as stored in the json file"""
+    documents = {}
+    for doc_id, document in table.items():
+        documents.setdefault(merge_key(table_name, document), (doc_id, document))
+    return documents
+
+def merge(base, ours, theirs):
+    """Apply the changes made from base to ours on top of theirs.
+
+    This is a three-way merge of the db: base is the db as this process last
+    read or wrote it, ours is what this process has now and theirs is what is
+    in the file now (which other easel processes may have written to in the
+    meantime). Documents are matched by their natural key (see MERGE_KEYS)
+    rather than their doc id, since each process numbers new documents on its
+    own. When both processes changed the same document, ours wins."""
+    base = base or {}
+    merged = copy.deepcopy(theirs or {})
+    for name in set(base) | set(ours):
+        base_docs = by_merge_key(name, base.get(name, {}))
+        our_docs = by_merge_key(name, ours.get(name, {}))
+        their_table = merged.setdefault(name, {})
+        their_ids = {key: doc_id for key, (doc_id, _) in
+                by_merge_key(name, their_table).items()}
+        next_id = max((int(doc_id) for doc_id in their_table), default=0) + 1
+        for key, (_, document) in our_docs.items():
+            if key in base_docs and base_docs[key][1] == document:
+                # we didn't change it
+                continue
+            if key in their_ids:
+                their_table[their_ids[key]] = document
+            else:
+                their_table[str(next_id)] = document
+                next_id += 1
+        for key in base_docs.keys() - our_docs.keys():
+            if key in their_ids:
+                del their_table[their_ids[key]]
+    return merged
+
+class AtomicJSONStorage(tinydb.storages.Storage):
+    """Stores the db as a json file like tinydb.storages.JSONStorage, but
+    writes a temporary file and moves it over the db so that the db file is
+    never left half written (e.g., if easel is interrupted).
+
+    Several easel processes may use the same db at once (e.g., pushing to
+    different sections in parallel). Writes hold a lock on path.lock and merge
+    this process's changes into whatever the others have written since."""
+
+    def __init__(self, path, create_dirs=False, encoding=None, **kwargs):
+        self.path = path
+        self.encoding = encoding
+        self.kwargs = kwargs
+        self.base = None
+        tinydb.storages.touch(path, create_dirs=create_dirs)
+
+    def decode(self, content):
+        return json.loads(content.decode(self.encoding or 'utf-8'))
+
+    def encode(self, data):
+        return json.dumps(data, **self.kwargs).encode(self.encoding or 'utf-8')
+
+    def read_file(self):
+        with open(self.path, 'rb') as f:
+            content = f.read()
+        if not content:
+            return None
+        return self.decode(content)
+
+    def dump(self, data):
+        """replace the file with data"""
+        tmp_path = f"{self.path}.{os.getpid()}.tmp"
+        with open(tmp_path, 'wb') as f:
+            f.write(self.encode(data))
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def read(self):
+        data = self.read_file()
+        self.base = copy.deepcopy(data)
+        return data
+
+    def write(self, data):
+        with FileLock(self.path + ".lock"):
+            self.dump(merge(self.base, data, self.read_file()))
+        self.base = copy.deepcopy(data)
+
+    def close(self):
+        pass
+
+class MsgpackStorage(AtomicJSONStorage):
+    """Stores the db in msgpack rather than json (see easel db migrate).
+
+    Besides being smaller and faster to read and write than indented json,
+    each filename is only stored once no matter how many courses (and tables)
+    it appears in. The documents refer to it by its position in a list of
+    filenames at the start of the file."""
+
+    def __init__(self, path, create_dirs=False, encoding=None, **kwargs):
+        if msgpack is None:
+            raise ValueError("the msgpack db format requires msgpack (pip "
+                    "install easel-cli[msgpack])")
+        # the json formatting options don't apply
+        super().__init__(path, create_dirs)
+
+    def decode(self, content):
+        if not content.startswith(MSGPACK_HEADER):
+            raise ValueError(f"{self.path} is not a msgpack db")
+        packed = msgpack.unpackb(content[len(MSGPACK_HEADER):],
+                strict_map_key=False)
+        filenames = packed['filenames']
+        for table in packed['tables'].values():
+            for document in table.values():
+                if isinstance(document.get('filename'), int):
+                    document['filename'] = filenames[document['filename']]
+        return packed['tables']
+
+    def encode(self, data):
+        filenames = {}
+        tables = {}
+        for name, table in data.items():
+            tables[name] = {}
+            for doc_id, document in table.items():
+                filename = document.get('filename')
+                if isinstance(filename, str):
+                    document = dict(document)
+                    document['filename'] = filenames.setdefault(filename,
+                            len(filenames))
+                tables[name][doc_id] = document
+        packed = {'filenames': list(filenames), 'tables': tables}
+        return MSGPACK_HEADER + msgpack.packb(packed)
+
+def is_msgpack(path):
+    """whether the file at path is a db stored with MsgpackStorage"""
+    try:
+        with open(path, 'rb') as f:
+            return f.read(len(MSGPACK_HEADER)) == MSGPACK_HEADER
+    except OSError:
+        return False
+
+# the file formats of the tinydb version of the db
+FORMATS = {
+        "json": AtomicJSONStorage,
+        "msgpack": MsgpackStorage,
+        }
+
+def migrate(db, path, storage_cls, backup_path, **kwargs):
+    """Copy every table of db into a new file at path stored with
+    storage_cls, keeping the document ids. The old file is kept in
+    backup_path."""
+    # the old file won't be written to again
+    db.flush()
+    data = {}
+    for name in db.tables():
+        data[name] = {str(document.doc_id): dict(document)
+                for document in db.table(name).all()}
+    tmp_path = path + ".tmp"
+    storage_cls(tmp_path, **kwargs).dump(data)
+    if hasattr(db, "backup"):
+        # e.g., an sqlite db, whose file may not hold every change yet
+        db.backup(backup_path)
+    else:
+        shutil.copy2(path, backup_path)
+    os.replace(tmp_path, path)
+
+class WriteBehind(tinydb.middlewares.CachingMiddleware):
+    """Keeps the db in memory and only writes it out every FLUSH_INTERVAL
+    seconds and when the db is closed, rather than after every change (see
+    __main__.main). Changes are written out by a timer even when nothing else
+    is written for a while (e.g., while waiting on canvas) so that they
+    survive the command being killed."""
+
+    WRITE_CACHE_SIZE = float('inf')
+
+    def __init__(self, storage_cls):
+        super().__init__(storage_cls)
+        self.flushed_at = time.monotonic()
+        self.timer = None
+
+    @locked
+    def write(self, data):
+        super().write(data)
+        if time.monotonic() - self.flushed_at >= FLUSH_INTERVAL:
+            self.flush()
+        elif self.timer is None:
+            self.timer = threading.Timer(FLUSH_INTERVAL, self.flush)
+            # don't keep easel running just to write the db, it's written
+            # when it's closed anyway
+            self.timer.daemon = True
+            self.timer.start()
+
+    @locked
+    def flush(self):
+        if self.timer is not None:
+            self.timer.cancel()
+            self.timer = None
+        super().flush()
+        self.flushed_at = time.monotonic()
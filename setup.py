@@ -15,6 +15,10 @@ setuptools.setup(
     long_description_content_type="text/markdown",
     url="https://github.com/renquinn/easel-py",
     install_requires=install_requires,
+    extras_require={
+        'fast': ['orjson'],
+        'msgpack': ['msgpack'],
+    },
     packages=setuptools.find_packages(exclude=['tests', 'tests.*']),
     classifiers=[
         "Programming Language :: Python :: 3",
@@ -0,0 +1,291 @@
+import concurrent.futures
+import json
+import threading
+import time
+
+import pytest
+
+from easel import api
+from easel import cache
+from easel import helpers
+
+
+class FakeConfig:
+    hostname = "my.canvas.com"
+    token = "my_token"
+    db_path = None
+    connect_timeout = None
+    read_timeout = None
+    retries = None
+
+
+def make_response(mocker, status=200, json_data=None, links=None):
+    resp = mocker.Mock()
+    resp.status_code = status
+    resp.links = links or {}
+    resp.headers = {'content-type': 'application/json'}
+    resp.content = json.dumps(json_data).encode()
+    return resp
+
+
+@pytest.fixture
+def client(mocker):
+    api.reset_client()
+    mocker.patch('easel.helpers.Config', return_value=FakeConfig())
+    yield api.get_client()
+    api.reset_client()
+
+
+def test_get_client_loads_config_once(client):
+    assert api.get_client() is client
+    assert helpers.Config.call_count == 1
+
+
+def test_reset_client(client):
+    api.reset_client()
+    assert api.get_client() is not client
+
+
+def test_request_uses_session(client, mocker):
+    send = mocker.patch.object(client.session, 'request',
+            return_value=make_response(mocker, json_data={"id": 1}))
+
+    assert helpers.get("/api/v1/courses/1") == {"id": 1}
+    args, kwargs = send.call_args
+    assert args == ("GET", "https://my.canvas.com/api/v1/courses/1")
+    assert kwargs['headers'] == {'Authorization': 'Bearer my_token'}
+
+
+def test_request_dry_run(client, mocker):
+    send = mocker.patch.object(client.session, 'request')
+    assert helpers.put("/api/v1/courses/1", {"a": 1}, dry_run=True) == {}
+    send.assert_not_called()
+
+
+def test_request_invalid_path(client):
+    with pytest.raises(ValueError, match="must start with /"):
+        helpers.get("api/v1/courses/1")
+
+
+def test_throttled_request_is_retried(client, mocker):
+    mocker.patch('easel.api.THROTTLE_WAIT', 0)
+    throttled = make_response(mocker, status=403)
+    throttled.text = "403 Forbidden (Rate Limit Exceeded)"
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        throttled, make_response(mocker, json_data={"id": 1})])
+
+    assert helpers.get("/api/v1/courses/1") == {"id": 1}
+    assert send.call_count == 2
+    assert client.limiter.limit == 1
+
+
+def test_rate_limiter_adapts_to_remaining(mocker):
+    limiter = api.RateLimiter(8)
+    low = make_response(mocker)
+    low.headers['X-Rate-Limit-Remaining'] = "150.0"
+    high = make_response(mocker)
+    high.headers['X-Rate-Limit-Remaining'] = "650.0"
+
+    limiter.acquire()
+    limiter.release(low)
+    assert limiter.limit == 4
+    limiter.acquire()
+    limiter.release(high)
+    assert limiter.limit == 5
+    assert limiter.in_flight == 0
+
+
+def test_failed_get_is_retried(client, mocker):
+    mocker.patch('easel.api.time.sleep')
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        make_response(mocker, status=503),
+        api.requests.ConnectionError(),
+        make_response(mocker, json_data={"id": 1})])
+
+    assert helpers.get("/api/v1/courses/1") == {"id": 1}
+    assert send.call_count == 3
+    assert send.call_args.kwargs['timeout'] == (api.CONNECT_TIMEOUT, api.READ_TIMEOUT)
+
+
+def test_retries_give_up(client, mocker):
+    mocker.patch('easel.api.time.sleep')
+    send = mocker.patch.object(client.session, 'request',
+            side_effect=api.requests.ReadTimeout())
+
+    with pytest.raises(api.requests.ReadTimeout):
+        helpers.delete("/api/v1/courses/1/pages/a")
+    assert send.call_count == api.RETRIES + 1
+
+
+def test_post_is_only_retried_when_safe():
+    assert api.should_retry("POST", error=api.requests.ConnectTimeout())
+    assert not api.should_retry("POST", error=api.requests.ReadTimeout())
+    assert api.should_retry("PUT", error=api.requests.ReadTimeout())
+
+
+def test_paginated_get_fetches_remaining_pages(client, mocker):
+    base = "https://my.canvas.com/api/v1/courses/1/pages?per_page=2&page={}"
+    links = {'next': {'url': base.format(2)}, 'last': {'url': base.format(4)}}
+    first = make_response(mocker, json_data=[1, 2], links=links)
+    pages = {
+        2: make_response(mocker, json_data=[3, 4]),
+        3: make_response(mocker, json_data=[5, 6]),
+        4: make_response(mocker, json_data=[7]),
+    }
+
+    def request(method, url, **kwargs):
+        if url.endswith("/pages"):
+            assert kwargs['params']['per_page'] == api.PER_PAGE
+            return first
+        return pages[api.page_number({'url': url})]
+
+    send = mocker.patch.object(client.session, 'request', side_effect=request)
+
+    assert helpers.get("/api/v1/courses/1/pages") == [1, 2, 3, 4, 5, 6, 7]
+    assert send.call_count == 4
+
+
+def test_paginated_get_follows_bookmarks(client, mocker):
+    bookmark = "https://my.canvas.com/api/v1/courses/1/pages?page=bookmark:abc"
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        make_response(mocker, json_data=[1], links={'next': {'url': bookmark}}),
+        make_response(mocker, json_data=[2])])
+
+    assert helpers.get("/api/v1/courses/1/pages") == [1, 2]
+    assert send.call_args.args[1] == bookmark
+
+
+def test_iter_get_yields_items_per_page(client, mocker):
+    bookmark = "https://my.canvas.com/api/v1/courses/1/pages?page=bookmark:abc"
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        make_response(mocker, json_data=[1, 2], links={'next': {'url': bookmark}}),
+        make_response(mocker, json_data=[3])])
+
+    items = helpers.iter_get("/api/v1/courses/1/pages")
+    assert next(items) == 1
+    assert send.call_count == 1
+    assert list(items) == [2, 3]
+    assert send.call_count == 2
+
+
+def test_cached_get_is_revalidated(client, mocker, tmp_path):
+    client.cache = cache.ResponseCache(str(tmp_path))
+    fresh = make_response(mocker, json_data={"id": 1})
+    fresh.headers['ETag'] = '"abc"'
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        fresh, make_response(mocker, status=304)])
+
+    assert helpers.get("/api/v1/courses/1") == {"id": 1}
+    client.memo.clear()
+    assert helpers.get("/api/v1/courses/1") == {"id": 1}
+    assert send.call_args.kwargs['headers']['If-None-Match'] == '"abc"'
+
+
+def test_not_modified_refreshes_cached_links(client, mocker, tmp_path):
+    client.cache = cache.ResponseCache(str(tmp_path))
+    base = "https://my.canvas.com/api/v1/courses/1/pages?per_page=1&page={}"
+
+    def first_page(status, last):
+        links = {'next': {'url': base.format(2)}, 'last': {'url': base.format(last)}}
+        resp = make_response(mocker, status=status, json_data=[1], links=links)
+        resp.headers['ETag'] = '"abc"'
+        resp.headers['Link'] = (f'<{base.format(2)}>; rel="next", '
+                f'<{base.format(last)}>; rel="last"')
+        return resp
+
+    firsts = [first_page(200, 2), first_page(304, 3)]
+
+    def request(method, url, **kwargs):
+        if url.endswith("/pages"):
+            return firsts.pop(0)
+        page = api.page_number({'url': url})
+        return make_response(mocker, json_data=[page])
+
+    mocker.patch.object(client.session, 'request', side_effect=request)
+
+    assert helpers.get("/api/v1/courses/1/pages") == [1, 2]
+    client.memo.clear()
+    # an item was added on a new page, the first page itself didn't change
+    assert helpers.get("/api/v1/courses/1/pages") == [1, 2, 3]
+
+
+def test_rejected_requests_are_counted(client, mocker):
+    mocker.patch.object(client.session, 'request', side_effect=[
+        make_response(mocker, json_data={"id": 1}),
+        make_response(mocker, status=400, json_data={"errors": ["bad"]})])
+
+    failures = api.failures()
+    helpers.put("/api/v1/courses/1/pages/a", {"title": "A"})
+    assert api.failures() == failures
+    helpers.put("/api/v1/courses/1/pages/a", {"title": ""})
+    assert api.failures() == failures + 1
+
+
+def test_write_invalidates_cached_get(client, mocker, tmp_path):
+    client.cache = cache.ResponseCache(str(tmp_path))
+    listing = make_response(mocker, json_data=[{"url": "a"}])
+    listing.headers['ETag'] = '"abc"'
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        listing, make_response(mocker, json_data={}),
+        make_response(mocker, json_data=[])])
+
+    helpers.get("/api/v1/courses/1/pages")
+    helpers.put("/api/v1/courses/1/pages/a", {"title": "A"})
+    assert helpers.get("/api/v1/courses/1/pages") == []
+    assert 'If-None-Match' not in send.call_args.kwargs['headers']
+
+
+def test_request_body_is_encoded_once(client, mocker):
+    mocker.patch('easel.api.time.sleep')
+    send = mocker.patch.object(client.session, 'request', side_effect=[
+        make_response(mocker, status=503), make_response(mocker, json_data={})])
+
+    helpers.put("/api/v1/courses/1/pages/a", {"wiki_page": {"title": "A"}})
+    first, second = send.call_args_list
+    assert first.kwargs['data'] is second.kwargs['data']
+    assert json.loads(second.kwargs['data']) == {"wiki_page": {"title": "A"}}
+    assert second.kwargs['headers']['Content-Type'] == 'application/json'
+
+
+def test_json_codec_without_orjson(mocker):
+    mocker.patch('easel.api.orjson', None)
+    assert api.loads(api.dumps({"a": [1, "b"]})) == {"a": [1, "b"]}
+
+
+def test_log_json_is_lazy(mocker):
+    dumps = mocker.patch('easel.api.json.dumps')
+    api.log_json("Data: ", {"a": 1})
+    dumps.assert_not_called()
+
+
+def test_repeated_get_is_remembered(client, mocker):
+    send = mocker.patch.object(client.session, 'request',
+            return_value=make_response(mocker, json_data={"id": 1}))
+
+    first = helpers.get("/api/v1/courses/1/folders/2")
+    first["id"] = 5
+    assert helpers.get("/api/v1/courses/1/folders/2") == {"id": 1}
+    assert send.call_count == 1
+    helpers.put("/api/v1/courses/1/folders/2", {"name": "notes"})
+    helpers.get("/api/v1/courses/1/folders/2")
+    assert send.call_count == 3
+
+
+def test_concurrent_gets_share_a_request(client, mocker):
+    started = threading.Event()
+    release = threading.Event()
+
+    def request(method, url, **kwargs):
+        started.set()
+        release.wait(5)
+        return make_response(mocker, json_data={"id": 1})
+
+    send = mocker.patch.object(client.session, 'request', side_effect=request)
+    with concurrent.futures.ThreadPoolExecutor(max_workers=2) as pool:
+        first = pool.submit(helpers.get, "/api/v1/courses/1/assignment_groups/3")
+        started.wait(5)
+        second = pool.submit(helpers.get, "/api/v1/courses/1/assignment_groups/3")
+        time.sleep(0.05)
+        release.set()
+        assert first.result() == second.result() == {"id": 1}
+    assert send.call_count == 1
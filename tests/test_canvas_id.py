@@ -0,0 +1,52 @@
+from easel import canvas_id
+from easel import storage
+
+
+def test_index_follows_saves_and_removes(tmp_path):
+    db = storage.EaselDB(str(tmp_path / ".easeldb"))
+    canvas_id.CanvasID("pages/a.yaml", 1, "a").save(db)
+    canvas_id.CanvasID("pages/b.yaml", 1, "b").save(db)
+    index = canvas_id.get_index(db)
+
+    canvas_id.CanvasID("pages/a.yaml", 1, "a-2").save(db)
+    canvas_id.CanvasID("pages/b.yaml", 1).remove(db)
+
+    assert canvas_id.get_index(db) is index
+    cid = canvas_id.CanvasID("pages/a.yaml", 1)
+    cid.find_id(db)
+    assert cid.canvas_id == "a-2"
+    assert canvas_id.find_by_id(db, 1, "a") is None
+    assert canvas_id.find_by_id(db, 1, "a-2").filename == "pages/a.yaml"
+    assert canvas_id.find_by_id(db, 1, "b") is None
+    # the index agrees with what's in the table
+    assert canvas_id.Index(db.table(canvas_id.TABLE).all()).by_course == index.by_course
+
+
+def test_index_is_loaded_once(tmp_path, mocker):
+    db = storage.EaselDB(str(tmp_path / ".easeldb"))
+    canvas_id.CanvasID("pages/a.yaml", 1, "a").save(db)
+    search = mocker.spy(db.table(canvas_id.TABLE), "search")
+
+    for _ in range(3):
+        cid = canvas_id.CanvasID("pages/a.yaml", 1)
+        cid.find_id(db)
+        assert cid.canvas_id == "a"
+    search.assert_not_called()
+
+
+def test_find_by_prefix(tmp_path):
+    db = storage.EaselDB(str(tmp_path / ".easeldb"))
+    for filename in ["modules/m.yaml--2", "modules/m.yaml", "modules/m.yaml--1",
+            "modules/mxyaml--1", "modules/n.yaml--1"]:
+        canvas_id.CanvasID(filename, 1, filename).save(db)
+    canvas_id.CanvasID("modules/m.yaml--3", 2, "other course").save(db)
+
+    children = canvas_id.find_by_prefix(db, 1, "modules/m.yaml--")
+    for child in children:
+        child.remove(db)
+
+    remaining = canvas_id.find_all_course_components(db, 1)
+    assert [c.filename for c in remaining] == ["modules/m.yaml",
+            "modules/mxyaml--1", "modules/n.yaml--1"]
+    assert canvas_id.get_index(db).filenames[1] == ["modules/m.yaml",
+            "modules/mxyaml--1", "modules/n.yaml--1"]
@@ -0,0 +1,79 @@
+from easel import canvas_id
+from easel import commands
+from easel import journal
+from easel import planner
+from easel import storage
+
+
+def test_db_compact_drops_orphans(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "pages").mkdir()
+    (tmp_path / "pages/a.yaml").write_text("!Page\ntitle: A\n")
+    (tmp_path / "modules").mkdir()
+    (tmp_path / "modules/m---1.yaml").write_text("!Module\nname: M\n")
+    db = storage.EaselDB(".easeldb")
+    db.table("courses").insert({"canvas_id": 1, "name": "CS 1400",
+        "code": "CS-1400-01", "workflow_state": "available"})
+    cids = db.table(canvas_id.TABLE)
+    cids.insert({"filename": "pages/a.yaml", "course_id": 1, "canvas_id": "a"})
+    cids.insert({"filename": "pages/a.yaml", "course_id": 1, "canvas_id": "a"})
+    cids.insert({"filename": "pages/a.yaml", "course_id": 2, "canvas_id": "a"})
+    cids.insert({"filename": "pages/gone.yaml", "course_id": 1, "canvas_id": "b"})
+    cids.insert({"filename": "modules/m---1.yaml--pages/a.yaml", "course_id": 1,
+        "canvas_id": 3})
+    db.table("pages").insert({"filename": "pages/gone.yaml"})
+
+    commands.cmd_db_compact(db, False)
+
+    assert [d["filename"] for d in cids.all()] == ["pages/a.yaml",
+            "modules/m---1.yaml--pages/a.yaml"]
+    assert len(db.table("pages")) == 0
+
+
+def test_db_verify_prunes_deleted_components(tmp_path, monkeypatch, mocker):
+    monkeypatch.chdir(tmp_path)
+    db = storage.EaselDB(".easeldb")
+    db.table("courses").insert({"canvas_id": 1, "name": "CS 1400",
+        "code": "CS-1400-01", "workflow_state": "available"})
+    cids = db.table(canvas_id.TABLE)
+    cids.insert({"filename": "pages/a.yaml", "course_id": 1, "canvas_id": "a"})
+    cids.insert({"filename": "pages/gone.yaml", "course_id": 1, "canvas_id": "b"})
+    cids.insert({"filename": "modules/m.yaml", "course_id": 1, "canvas_id": 3})
+    cids.insert({"filename": "modules/m.yaml--pages/a.yaml", "course_id": 1,
+        "canvas_id": 4})
+    cids.insert({"filename": "modules/m.yaml--pages/gone.yaml", "course_id": 1,
+        "canvas_id": 5})
+    cids.insert({"filename": "grading_scheme.yaml", "course_id": 1,
+        "canvas_id": 6})
+    lists = {
+        "/api/v1/courses/1/pages": [{"url": "a"}, {"url": "c"}],
+        "/api/v1/courses/1/modules": [{"id": 3, "items": [{"id": 4}]}],
+        }
+    get = mocker.patch("easel.helpers.get",
+            side_effect=lambda path, params={}: lists[path])
+
+    commands.cmd_db_verify(db, True, False)
+
+    # one request per kind of component
+    assert get.call_count == 2
+    assert [d["filename"] for d in cids.all()] == ["pages/a.yaml",
+            "modules/m.yaml", "modules/m.yaml--pages/a.yaml",
+            "grading_scheme.yaml"]
+
+
+def test_journal_skips_rejected_push(tmp_path, monkeypatch, mocker):
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "a.yaml").write_text("!Page\ntitle: A\n")
+    (tmp_path / "b.yaml").write_text("!Page\ntitle: B\n")
+    journal_ = journal.Journal()
+    journal_.start()
+    course_ = mocker.Mock(canvas_id=1)
+    # canvas rejects one of the requests made while pushing b.yaml
+    mocker.patch("easel.api.failures", side_effect=[0, 0, 0, 1])
+
+    for filename in ["a.yaml", "b.yaml"]:
+        commands.journaled(journal_, course_, planner.Node(filename),
+                lambda: None, False)()
+
+    assert journal_.done(1, "a.yaml", planner.Node("a.yaml").content_hash())
+    assert not journal_.done(1, "b.yaml", planner.Node("b.yaml").content_hash())
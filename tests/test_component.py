@@ -0,0 +1,128 @@
+# the component modules import each other through helpers_yaml, which has to
+# be imported first
+from easel import helpers_yaml
+
+from easel import assignment
+from easel import assignment_group
+from easel import canvas_id
+from easel import component
+from easel import storage
+
+
+def test_records_follow_saves(tmp_path):
+    db = storage.EaselDB(str(tmp_path / ".easeldb"))
+    group = assignment_group.AssignmentGroup("Homework", 1, 10,
+            "assignment_groups/hw.yaml")
+    group.save(db)
+    records = component.get_records(db, assignment_group.ASSIGN_GROUPS_TABLE)
+
+    group.name = "Assignments"
+    group.save(db)
+
+    assert component.get_records(db, assignment_group.ASSIGN_GROUPS_TABLE) is records
+    assert assignment_group.find_by_name(db, "Homework") is None
+    assert assignment_group.find_by_name(db, "Assignments").filename == group.filename
+    assert group.find(db) == [dict(r) for r in
+            db.table(assignment_group.ASSIGN_GROUPS_TABLE).search(group.gen_query())]
+
+
+def test_assignment_group_id(tmp_path):
+    db = storage.EaselDB(str(tmp_path / ".easeldb"))
+    assignment_group.AssignmentGroup("Homework",
+            filename="assignment_groups/hw.yaml").save(db)
+    canvas_id.CanvasID("assignment_groups/hw.yaml", 1, 55).save(db)
+
+    hw = assignment.Assignment(name="HW 1", assignment_group="Homework")
+    hw.get_assignment_group_id(db, 1)
+    assert hw.assignment_group_id == 55
+
+
+def test_push_skips_unchanged(tmp_path, mocker):
+    db = storage.EaselDB(str(tmp_path / ".easeldb"))
+    course_ = mocker.Mock(canvas_id=1)
+    post = mocker.patch("easel.helpers.post", return_value={"id": 55})
+    put = mocker.patch("easel.helpers.put", return_value={"id": 55})
+    group = assignment_group.AssignmentGroup("Homework", 1, 10,
+            "assignment_groups/hw.yaml")
+
+    group.push(db, course_, False)
+    group.push(db, course_, False)
+    assert post.call_count == 1
+    assert put.call_count == 0
+
+    group.group_weight = 20
+    group.push(db, course_, False)
+    group.push(db, course_, False)
+    assert put.call_count == 1
+
+    component.set_force(True)
+    try:
+        group.push(db, course_, False)
+    finally:
+        component.set_force(False)
+    assert put.call_count == 2
+
+
+def test_push_quiz_when_its_bank_changes(tmp_path, monkeypatch, mocker):
+    from easel import course
+    from easel import quiz
+    monkeypatch.chdir(tmp_path)
+    (tmp_path / "bank.yaml").write_text(
+            "- !QuizQuestion\n  question_name: Q1\n  question_type: essay_question\n")
+    db = storage.EaselDB(".easeldb")
+    course_ = course.Course(1, "CS 1400 Fall 2023 (12345)", "CS-1400-01")
+    post = mocker.patch("easel.helpers.post", return_value={"id": 55})
+    put = mocker.patch("easel.helpers.put", return_value={"id": 55})
+    mocker.patch("easel.helpers.get", return_value=[])
+    mocker.patch("easel.helpers.delete", return_value={})
+
+    def push():
+        # each push is a new run
+        monkeypatch.setattr(quiz, "_banks", {})
+        q = quiz.Quiz(title="Quiz 1", published=True, description="Hi",
+                quiz_questions=["bank.yaml"], filename="quizzes/q1.yaml")
+        q.push(db, course_, False)
+
+    push()
+    # the quiz and its question, publishing it
+    assert (post.call_count, put.call_count) == (2, 1)
+    push()
+    assert (post.call_count, put.call_count) == (2, 1)
+
+    (tmp_path / "bank.yaml").write_text(
+            "- !QuizQuestion\n  question_name: Q1 (edited)\n  question_type: essay_question\n")
+    push()
+    # the quiz, publishing it and the edited question
+    assert (post.call_count, put.call_count) == (3, 3)
+
+
+def test_dry_run_push_of_quiz_writes_nothing(tmp_path, monkeypatch, mocker):
+    from easel import course
+    from easel import quiz
+    monkeypatch.chdir(tmp_path)
+    db = storage.EaselDB(".easeldb")
+    course_ = course.Course(1, "CS 1400 Fall 2023 (12345)", "CS-1400-01")
+    post = mocker.patch("easel.helpers.post", return_value={"id": 55})
+    put = mocker.patch("easel.helpers.put", return_value={"id": 55})
+    mocker.patch("easel.helpers.get", return_value=[])
+    delete = mocker.patch("easel.helpers.delete", return_value={})
+
+    def push(dry_run):
+        q = quiz.Quiz(title="Quiz 1", published=True, description="Hi",
+                quiz_questions=[{"question_name": "Q1",
+                    "question_type": "essay_question"}],
+                filename="quizzes/q1.yaml")
+        q.push(db, course_, dry_run)
+
+    push(False)
+    mocks = [post, put, delete]
+    before = [m.call_count for m in mocks]
+    component.set_force(True)
+    try:
+        push(True)
+    finally:
+        component.set_force(False)
+    calls = [c for m, n in zip(mocks, before) for c in m.call_args_list[n:]]
+    # updating the quiz, its question and publishing it
+    assert len(calls) >= 3
+    assert all(c.kwargs.get("dry_run") for c in calls)
@@ -4,6 +4,8 @@ import requests
 import json
 from pathlib import Path
 
+import markdown
+
 from easel import helpers
 
 def test_isurl():
@@ -90,3 +92,37 @@ def test_config_no_home_directory(mocker):
 
     with pytest.raises(ValueError, match="home directory is not set"):
         helpers.Config()
+
+def test_md2html(mocker):
+    helpers.render_markdown.cache_clear()
+    convert = mocker.spy(helpers, "get_markdown")
+    text = "# Lesson {n}\n\nSee {files/notes.pdf}\n\n| a |\n|---|\n| 1 |\n"
+    args = {"n": 1, "files_notes_pdf": "notes.html"}
+
+    html = helpers.md2html(text, args)
+    assert html.startswith("<h1>Lesson 1</h1>\n<p>See notes.html</p>\n<table>")
+    # the markdown for the next component doesn't carry over
+    assert helpers.md2html("plain") == "<p>plain</p>"
+    assert helpers.md2html(text, args) == html
+    assert convert.call_count == 2
+
+def test_md2html_renders_once_for_every_course(mocker):
+    helpers.render_markdown.cache_clear()
+    convert = mocker.spy(helpers, "get_markdown")
+    text = ("# {code}\n\n[HW 1](/courses/{course_id}/assignments/{hw1})\n\n"
+            "```python\nprint('hi')\n```\n")
+
+    for course_id in [1, 2, 3]:
+        args = {"code": "CS 1400", "course_id": course_id, "hw1": 100 + course_id}
+        html = helpers.md2html(text, args)
+        assert html == markdown.markdown(text.format(**args),
+                extensions=helpers.MD_EXTENSIONS,
+                extension_configs=helpers.MD_CONFIG)
+    assert convert.call_count == 1
+
+def test_md2html_falls_back_to_rendering_the_values():
+    # the values change how the markdown around them is converted
+    assert helpers.md2html("{a}", {"a": "*new*"}) == "<p><em>new</em></p>"
+    assert helpers.md2html("{a}1. item", {"a": "1"}) == "<ol>\n<li>item</li>\n</ol>"
+    assert helpers.md2html("```\n{a}\n```", {"a": "x-y"}) == helpers.render_markdown(
+            "```\nx-y\n```")
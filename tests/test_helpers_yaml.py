@@ -0,0 +1,52 @@
+import os
+
+from easel import helpers_yaml
+
+
+def test_read_reuses_parsed_file(tmp_path, mocker):
+    path = tmp_path / "a.yaml"
+    path.write_text("!Page\ntitle: A\n")
+    parse = mocker.spy(helpers_yaml, "parse")
+
+    first = helpers_yaml.read(str(path))
+    first.title = "changed"
+    second = helpers_yaml.read(str(path))
+    assert second.title == "A"
+    assert parse.call_count == 1
+
+    path.write_text("!Page\ntitle: Lesson A\n")
+    assert helpers_yaml.read(str(path)).title == "Lesson A"
+    assert parse.call_count == 2
+
+
+def test_read_disk_cache(tmp_path, mocker):
+    path = tmp_path / "a.yaml"
+    path.write_text("!Page\ntitle: A\n")
+    helpers_yaml.set_disk_cache(str(tmp_path / "cache"))
+    try:
+        helpers_yaml.read(str(path))
+        assert len(os.listdir(tmp_path / "cache")) == 1
+
+        # a new run
+        helpers_yaml._parsed.clear()
+        parse = mocker.spy(helpers_yaml, "parse")
+        assert helpers_yaml.read(str(path)).title == "A"
+        assert parse.call_count == 0
+    finally:
+        helpers_yaml.set_disk_cache(None)
+
+
+def test_write_round_trip(tmp_path):
+    from easel import page
+    path = str(tmp_path / "a.yaml")
+    lesson = page.Page(title="Lesson 1", body="# Intro\n\nSome text.\n",
+            published=True)
+    helpers_yaml.write(path, lesson)
+    text = open(path).read()
+    assert text.startswith("!Page\n")
+    assert "body: |" in text
+
+    read_back = helpers_yaml.read(path)
+    assert dict(read_back) == dict(lesson)
+    helpers_yaml.write(path, read_back)
+    assert open(path).read() == text
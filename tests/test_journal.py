@@ -0,0 +1,41 @@
+from easel import journal
+
+
+def test_resume_skips_finished_work(tmp_path):
+    path = str(tmp_path / ".easeljournal")
+    first = journal.Journal(path)
+    first.start()
+    first.record(1, "pages/a.yaml", "abc")
+    first.record(2, "pages/a.yaml", "abc")
+    with open(path, 'a') as f:
+        # interrupted while writing
+        f.write('{"course_id": 1, "filen')
+
+    resumed = journal.Journal(path)
+    resumed.start(resume=True)
+    assert resumed.done(1, "pages/a.yaml", "abc")
+    assert not resumed.done(1, "pages/a.yaml", "changed")
+    assert not resumed.done(3, "pages/a.yaml", "abc")
+
+    fresh = journal.Journal(path)
+    fresh.start()
+    assert not fresh.done(1, "pages/a.yaml", "abc")
+
+
+def test_record_after_interrupted_write_is_kept(tmp_path):
+    path = str(tmp_path / ".easeljournal")
+    first = journal.Journal(path)
+    first.start()
+    first.record(1, "pages/a.yaml", "abc")
+    with open(path, 'a') as f:
+        # interrupted while writing
+        f.write('{"course_id": 1, "filen')
+
+    resumed = journal.Journal(path)
+    resumed.start(resume=True)
+    resumed.record(1, "pages/b.yaml", "def")
+
+    again = journal.Journal(path)
+    again.start(resume=True)
+    assert again.done(1, "pages/a.yaml", "abc")
+    assert again.done(1, "pages/b.yaml", "def")
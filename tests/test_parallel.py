@@ -0,0 +1,59 @@
+import threading
+import time
+
+import pytest
+
+from easel import parallel
+
+
+def test_run_sequential_keeps_order():
+    seen = []
+    parallel.run([lambda i=i: seen.append(i) for i in range(5)])
+    assert seen == [0, 1, 2, 3, 4]
+
+
+def test_run_groups_task_output(capsys):
+    barrier = threading.Barrier(3)
+
+    def task(name):
+        print(f"{name} start")
+        barrier.wait()
+        print(f"{name} end")
+
+    parallel.run([lambda n=n: task(n) for n in "abc"], jobs=3)
+
+    lines = capsys.readouterr().out.splitlines()
+    assert len(lines) == 6
+    for i in range(0, 6, 2):
+        name = lines[i].split()[0]
+        assert lines[i:i+2] == [f"{name} start", f"{name} end"]
+
+
+def test_run_reraises_task_error():
+    def fail():
+        raise ValueError("bad component")
+
+    with pytest.raises(ValueError, match="bad component"):
+        parallel.run([fail, lambda: None], jobs=2)
+
+
+def test_imap_keeps_order():
+    def slow_square(i):
+        time.sleep(0.01 * (5 - i))
+        return i * i
+
+    assert list(parallel.imap(slow_square, range(5), jobs=3)) == [0, 1, 4, 9, 16]
+
+
+def test_imap_consumes_items_lazily():
+    taken = []
+
+    def items():
+        for i in range(100):
+            taken.append(i)
+            yield i
+
+    results = parallel.imap(lambda i: i, items(), jobs=2)
+    assert next(results) == 0
+    assert len(taken) <= 4
+    results.close()
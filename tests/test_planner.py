@@ -0,0 +1,63 @@
+import pytest
+
+from easel import planner
+
+
+@pytest.fixture
+def course_dir(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    for d in ["assignment_groups", "assignments", "files", "modules", "pages"]:
+        (tmp_path / d).mkdir()
+    (tmp_path / "assignment_groups/hw.yaml").write_text(
+            "!AssignmentGroup\nname: Homework\n")
+    (tmp_path / "assignments/hw1.yaml").write_text(
+            "!Assignment\nname: HW 1\nassignment_group: Homework\n")
+    (tmp_path / "files/notes.pdf").write_text("notes")
+    (tmp_path / "pages/intro.yaml").write_text(
+            "!Page\ntitle: Intro\nbody: 'see {hw1} and {files/notes.pdf}'\n")
+    (tmp_path / "modules/week1.yaml").write_text(
+            "!Module\nname: Week 1\nitems:\n- pages/intro.yaml\n- Reading\n")
+    return tmp_path
+
+
+def filenames(waves):
+    return [sorted(node.filename for node in wave) for wave in waves]
+
+
+def test_waves_follow_dependencies(course_dir):
+    plan = planner.Plan()
+    for d in ["modules", "pages", "files", "assignments", "assignment_groups"]:
+        plan.add(d)
+
+    assert filenames(plan.waves()) == [
+            ["assignment_groups/hw.yaml", "files/notes.pdf"],
+            ["assignments/hw1.yaml"],
+            ["pages/intro.yaml"],
+            ["modules/week1.yaml"],
+            ]
+
+
+def test_nodes_are_added_once(course_dir):
+    plan = planner.Plan()
+    plan.add("assignments")
+    plan.add("assignments/hw1.yaml")
+    plan.add("assignments/")
+
+    assert list(plan.nodes) == ["assignments/hw1.yaml"]
+
+
+def test_dependencies_outside_the_plan_are_ignored(course_dir):
+    plan = planner.Plan()
+    plan.add("pages/intro.yaml")
+
+    assert filenames(plan.waves()) == [["pages/intro.yaml"]]
+
+
+def test_circular_dependencies(course_dir):
+    (course_dir / "pages/a.yaml").write_text("!Page\ntitle: A\nbody: '{b}'\n")
+    (course_dir / "pages/b.yaml").write_text("!Page\ntitle: B\nbody: '{a}'\n")
+    plan = planner.Plan()
+    plan.add("pages/a.yaml")
+    plan.add("pages/b.yaml")
+
+    assert filenames(plan.waves()) == [["pages/a.yaml"], ["pages/b.yaml"]]
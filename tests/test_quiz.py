@@ -0,0 +1,32 @@
+# the component modules import each other through helpers_yaml, which has to
+# be imported first
+from easel import helpers_yaml
+
+import pytest
+
+from easel import quiz
+
+
+@pytest.fixture
+def bank(tmp_path, monkeypatch):
+    monkeypatch.chdir(tmp_path)
+    monkeypatch.setattr(quiz, "_banks", {})
+    questions = "\n".join(f"- !QuizQuestion\n  id: q{i}\n  question_name: Q{i}"
+            for i in range(5))
+    (tmp_path / "bank.yaml").write_text(questions + "\n")
+    return "bank.yaml"
+
+
+def test_build_questions_from_bank(bank):
+    questions = quiz.build_questions([{"bank": bank, "id": "q3"}] +
+            [{"bank": bank}] * 4)
+
+    names = [q.question_name for q in questions]
+    assert names[0] == "Q3"
+    assert questions[0].id is None
+    assert sorted(names) == [f"Q{i}" for i in range(5)]
+
+
+def test_build_questions_bank_runs_out(bank):
+    with pytest.raises(ValueError, match="ran out"):
+        quiz.build_questions([{"bank": bank}] * 6)
@@ -0,0 +1,92 @@
+import tinydb
+
+from easel import canvas_id
+from easel import sqlite_db
+from easel import storage
+
+
+def test_compile_query():
+    CID = tinydb.Query()
+    query = (CID.filename == "pages/a.yaml") & (CID.course_id == 1)
+    sql, args, exact = sqlite_db.compile_query(query._hash)
+    assert exact
+    assert sorted(args, key=str) == [1, "pages/a.yaml"]
+
+    sql, args, exact = sqlite_db.compile_query(CID.filename.matches("^m.yaml--")._hash)
+    assert args == [1, "m"]
+    assert not exact
+
+    assert sqlite_db.compile_query(CID.code.test(lambda c: True)._hash) is None
+
+
+def test_canvas_ids_use_the_index(tmp_path):
+    db = sqlite_db.SQLiteDB(str(tmp_path / "db"))
+    CID = tinydb.Query()
+    query = (CID.filename == "a") & (CID.course_id == 1)
+    sql, args, _ = sqlite_db.compile_query(query._hash)
+    plan = db.conn.execute("EXPLAIN QUERY PLAN SELECT data FROM documents "
+            "WHERE tbl = ? AND " + sql, ["canvas_ids"] + args).fetchall()
+    assert "documents_filename" in str(plan)
+
+
+def test_table_matches_tinydb(tmp_path):
+    db = sqlite_db.SQLiteDB(str(tmp_path / "db"))
+    for course_id in [1, 2]:
+        for filename in ["modules/m.yaml", "modules/m.yaml--1", "pages/p.yaml"]:
+            canvas_id.CanvasID(filename, course_id, filename + "!").save(db)
+    cid = canvas_id.CanvasID("pages/p.yaml", 2, "new")
+    cid.save(db)
+
+    found = canvas_id.CanvasID("pages/p.yaml", 2)
+    found.find_id(db)
+    assert found.canvas_id == "new"
+    assert len(db.table(canvas_id.TABLE)) == 6
+    assert canvas_id.find_by_id(db, 1, "pages/p.yaml!").filename == "pages/p.yaml"
+    children = canvas_id.find_by_prefix(db, 1, "modules/m.yaml--")
+    assert [c.filename for c in children] == ["modules/m.yaml--1"]
+    cid.remove(db)
+    assert len(list(canvas_id.find_all_course_components(db, 2))) == 2
+    db.close()
+
+
+def test_migrate(tmp_path):
+    path = str(tmp_path / ".easeldb")
+    db = storage.EaselDB(path)
+    db.table("courses").insert({"canvas_id": 1, "name": "CS 1400"})
+    canvas_id.CanvasID("pages/p.yaml", 1, "p").save(db)
+
+    sqlite_db.migrate(db, path, path + ".json")
+    db.close()
+
+    assert sqlite_db.is_sqlite(path)
+    migrated = sqlite_db.SQLiteDB(path)
+    assert migrated.tables() == {"courses", canvas_id.TABLE}
+    assert migrated.table("courses").all() == [{"canvas_id": 1, "name": "CS 1400"}]
+    assert not sqlite_db.is_sqlite(path + ".json")
+
+
+def test_migrate_from_sqlite_keeps_a_backup(tmp_path):
+    path = str(tmp_path / ".easeldb")
+    db = sqlite_db.SQLiteDB(path)
+    db.table("courses").insert({"canvas_id": 1, "name": "CS 1400"})
+
+    storage.migrate(db, path, storage.AtomicJSONStorage, path + ".sqlite")
+    db.close()
+
+    assert not sqlite_db.is_sqlite(path)
+    backup = sqlite_db.SQLiteDB(path + ".sqlite")
+    assert backup.table("courses").all() == [{"canvas_id": 1, "name": "CS 1400"}]
+    backup.close()
+
+
+def test_connections_share_the_db(tmp_path):
+    path = str(tmp_path / "db")
+    first = sqlite_db.SQLiteDB(path)
+    second = sqlite_db.SQLiteDB(path)
+    canvas_id.CanvasID("pages/p.yaml", 1, "p1").save(first)
+    canvas_id.CanvasID("pages/p.yaml", 2, "p2").save(second)
+
+    assert first.conn.execute("PRAGMA journal_mode").fetchone()[0] == "wal"
+    assert len(first.table(canvas_id.TABLE)) == 2
+    first.close()
+    second.close()
@@ -0,0 +1,103 @@
+import time
+
+import pytest
+
+from easel import storage
+
+
+def open_db(path):
+    return storage.EaselDB(str(path),
+            storage=storage.WriteBehind(storage.AtomicJSONStorage))
+
+
+def test_writes_are_flushed_on_close(tmp_path):
+    path = tmp_path / ".easeldb"
+    db = open_db(path)
+    for i in range(10):
+        db.table("pages").insert({"filename": f"pages/{i}.yaml"})
+    assert path.read_text() == ""
+
+    db.close()
+    assert len(open_db(path).table("pages")) == 10
+    assert not (tmp_path / ".easeldb.tmp").exists()
+
+
+def test_writes_are_flushed_periodically(tmp_path, mocker):
+    path = tmp_path / ".easeldb"
+    db = open_db(path)
+    db.table("pages").insert({"filename": "pages/a.yaml"})
+    mocker.patch('easel.storage.FLUSH_INTERVAL', 0)
+    db.table("pages").insert({"filename": "pages/b.yaml"})
+
+    assert len(open_db(path).table("pages")) == 2
+
+
+def test_writes_are_flushed_without_another_write(tmp_path, mocker):
+    path = tmp_path / ".easeldb"
+    mocker.patch('easel.storage.FLUSH_INTERVAL', 0.05)
+    db = open_db(path)
+    db.table("pages").insert({"filename": "pages/a.yaml"})
+
+    deadline = time.monotonic() + 5
+    while path.read_text() == "" and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert len(open_db(path).table("pages")) == 1
+    db.close()
+
+
+def test_processes_merge_their_changes(tmp_path):
+    path = tmp_path / ".easeldb"
+    setup = open_db(path)
+    setup.table("canvas_ids").insert({"filename": "pages/a.yaml", "course_id": 1,
+        "canvas_id": "a"})
+    setup.table("canvas_ids").insert({"filename": "pages/gone.yaml", "course_id": 1,
+        "canvas_id": "gone"})
+    setup.close()
+
+    # two processes working on different sections at the same time
+    first = open_db(path)
+    second = open_db(path)
+    first.table("canvas_ids").insert({"filename": "pages/a.yaml", "course_id": 2,
+        "canvas_id": "a2"})
+    second.table("canvas_ids").insert({"filename": "pages/a.yaml", "course_id": 3,
+        "canvas_id": "a3"})
+    second.table("canvas_ids").remove(doc_ids=[2])
+    first.close()
+    second.close()
+
+    merged = open_db(path).table("canvas_ids").all()
+    assert sorted((d["course_id"], d["canvas_id"]) for d in merged) == [
+            (1, "a"), (2, "a2"), (3, "a3")]
+
+
+def test_merge_prefers_our_changes():
+    base = {"pages": {"1": {"filename": "a", "title": "A"}}}
+    ours = {"pages": {"1": {"filename": "a", "title": "ours"}}}
+    theirs = {"pages": {"1": {"filename": "a", "title": "theirs"},
+        "2": {"filename": "b", "title": "B"}}}
+
+    assert storage.merge(base, ours, theirs) == {"pages": {
+        "1": {"filename": "a", "title": "ours"},
+        "2": {"filename": "b", "title": "B"}}}
+
+
+def test_msgpack_round_trip(tmp_path):
+    pytest.importorskip("msgpack")
+    path = str(tmp_path / ".easeldb")
+    db = open_db(path)
+    for course_id in [1, 2, 3]:
+        db.table("canvas_ids").insert({"filename": "pages/a.yaml",
+            "course_id": course_id, "canvas_id": "a"})
+    db.table("pages").insert({"filename": "pages/a.yaml", "title": "A"})
+
+    storage.migrate(db, path, storage.MsgpackStorage, path + ".json")
+    db.close()
+
+    assert storage.is_msgpack(path)
+    with open(path, 'rb') as f:
+        assert f.read().count(b"pages/a.yaml") == 1
+    migrated = storage.EaselDB(path,
+            storage=storage.WriteBehind(storage.MsgpackStorage))
+    assert migrated.table("pages").all() == [{"filename": "pages/a.yaml",
+        "title": "A"}]
+    assert len(migrated.table("canvas_ids")) == 3